@@ -21,7 +21,7 @@ def main():
     player = None
     try:
         player = cage.ImagePlayer(400, 600)
-        automaton = cage.LinearCodedAutomaton(player.size, RULE)
+        automaton = cage.LinearCodedAutomaton(player.size, RULE, packed=1)
         rightMostAddress = player.size[0] - 1,
         if RANDOM:
             initializer = cage.RandomInitializer()
@@ -20,7 +20,9 @@ class TimedLinearCodedAutomaton(cage.LinearCodedAutomaton):
         cage.LinearCodedAutomaton.__init__(self, size, code)
 
     def running(self):
-        return self.generation < divmod(self.map.length, 2)[0]
+        # Stop early once the automaton has settled into a cycle.
+        return (self.generation < divmod(self.map.length, 2)[0] and 
+                not self.settled())
         
 
 def main():
@@ -32,6 +34,7 @@ def main():
             player = cage.LinePlayer(79)
             automaton = TimedLinearCodedAutomaton(player.size, code)
             cage.PointInitializer().initialize(automaton)
+            automaton.detectCycles()
             player.main(automaton)
         finally:
             if player is not None:
@@ -23,7 +23,9 @@ class LinearTotalisticAutomaton(cage.SynchronousAutomaton):
         self.populate(code)
 
     def running(self):
-        return self.generation < divmod(self.map.length, 2)[0]
+        # Stop early once the automaton has settled into a cycle.
+        return (self.generation < divmod(self.map.length, 2)[0] and 
+                not self.settled())
 
     def populate(self, code):
         sums = (2*self.map.radius + 1) + 1
@@ -36,6 +38,20 @@ class LinearTotalisticAutomaton(cage.SynchronousAutomaton):
     def rule(self, address):
         return self.table[self.map.inclusiveSum(address)]
 
+    def sweep(self, map):
+        # Sum up the neighborhoods of all the cells at once, sliding a
+        # window along the line, rather than cell by cell.
+        states = [self.table[x] for x in self.map.windowSums()]
+        current = self.map.buffer
+        map.buffer[:len(states)] = states
+        if self.hashes is None:
+            return None
+        return [x for x in range(len(states)) if states[x] != current[x]]
+
+    def field(self, padded):
+        # For compact maps, make the sums from the padded line instead.
+        return cage.numpy.asarray(self.table)[self.map.windowSums(1, padded)]
+
 
 def main():
     player = None
@@ -48,6 +64,7 @@ def main():
             player = cage.LinePlayer(79)
             automaton = LinearTotalisticAutomaton(player.size, k, r, code)
             cage.RandomInitializer().initialize(automaton)
+            automaton.detectCycles()
             player.main(automaton)
         finally:
             if player is not None:
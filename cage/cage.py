@@ -14,9 +14,20 @@ __copyright__ = 'Copyright (C) 2002-2006 Erik Max Francis'
 __license__ = 'GPL'
 
 
+import array
+import copy
+import hashlib
+import itertools
 import operator
+import os
+import pickle
 import random
+import re
+import struct
+import tempfile
 import types
+import warnings
+import zlib
 from functools import reduce
 
 try:
@@ -29,6 +40,52 @@ try:
 except ImportError:
     Image = None
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from concurrent import futures
+except ImportError:
+    futures = None
+
+try:
+    import multiprocessing
+    from multiprocessing import shared_memory
+except ImportError:
+    multiprocessing = None
+
+
+def arrayType(states, signed=0):
+    """Return the smallest NumPy integer type which can hold the given
+    number of states (signed, if states can go negative)."""
+    assert numpy is not None
+    if signed:
+        types = numpy.int8, numpy.int16, numpy.int32, numpy.int64
+    else:
+        types = numpy.uint8, numpy.uint16, numpy.uint32, numpy.uint64
+    for dtype in types:
+        if states <= numpy.iinfo(dtype).max + 1:
+            return dtype
+    raise NotImplementedError
+
+
+def indexCode(count):
+    """Return the array typecode for a table of indices below the given
+    count:  32-bit integers if they will do, 64-bit otherwise."""
+    if count <= 1 << 31:
+        return 'i'
+    return 'q'
+
+
+def values(sequence):
+    """Return a sequence (a list, an array.array, or a NumPy array) as a
+    list of plain Python values."""
+    if isinstance(sequence, list):
+        return sequence
+    return sequence.tolist()
+
 
 #
 # Topology
@@ -42,6 +99,15 @@ class Topology:
     
     dimension = None
     background = 0
+    dtype = None # the NumPy type of the buffer, or None for a list
+    packed = 0 # whether the buffer holds one bit per cell
+    flat = 0 # whether the buffer holds one cell per index (see index)
+    sparse = 0 # whether addresses covers only the cells in use
+    mapped = 0 # whether the buffer is a file mapped into memory
+    indexed = 1 # whether flat maps read neighbors through a table of indices
+    keys = None # the Zobrist keys of the cells, if hashing (see hashKeys)
+    keyStates = None # the number of states keys are drawn for
+    zobrist = None # the Zobrist hash of the cells, if known
     
     def __init__(self, size):
         if self.__class__ is Topology:
@@ -50,6 +116,9 @@ class Topology:
         self.size = size
         self.cells = reduce(operator.mul, self.size, 1)
         self.zero = (0,)*self.dimension
+        # The viewport, for displaying and seeding the topology, is the
+        # block of the given size starting at the origin.
+        self.origin = self.zero
 
     def isNormalized(self, address):
         """Is the address already normalized?"""
@@ -72,15 +141,260 @@ class Topology:
         """Reset the state of the cell to the background."""
         self.set(address, self.background)
 
+    def hashKeys(self, states):
+        """Start hashing the cells of a flat map with Zobrist hashing:  a
+        random 64-bit key is drawn for each state of each cell, and the
+        hash is the exclusive or of the keys of the states the cells
+        are in, so that it can be kept up to date cheaply as cells are
+        set.  The keys come from a generator of their own, so as not to
+        disturb the sequence of the random module, and are held in a
+        single flat array of unsigned 64-bit integers, the key for the
+        state of the cell at index being at index*states + state.  Maps
+        which aren't flat (packed, sparse and HashLife maps) get no
+        keys; their hash is worked out afresh each time instead (see
+        digest)."""
+        self.keyStates = states
+        self.zobrist = None
+        if not self.flat:
+            self.keys = None
+            return
+        generator = random.Random(self.cells)
+        self.keys = array.array('Q')
+        self.keys.frombytes(generator.randbytes(8*self.cells*states))
+
+    def keyArray(self):
+        """Return the keys as a NumPy array with a row for each cell and a
+        column for each state (sharing the memory of the keys)."""
+        return numpy.frombuffer(self.keys, numpy.uint64).reshape(self.cells, 
+                                                                 self.keyStates)
+
+    def fingerprint(self):
+        """Return the Zobrist hash of the cells (see hashKeys), working it
+        out from scratch if it isn't known, or for a map with no keys,
+        their digest."""
+        if self.keys is None:
+            return self.digest()
+        if self.zobrist is None:
+            buffer = self.buffer
+            if self.dtype is not None:
+                keys = self.keyArray()[numpy.arange(self.cells), 
+                                       buffer[:self.cells]]
+                self.zobrist = int(numpy.bitwise_xor.reduce(keys))
+            else:
+                keys, states = self.keys, self.keyStates
+                zobrist = 0
+                for index in range(self.cells):
+                    zobrist ^= keys[index*states + buffer[index]]
+                self.zobrist = zobrist
+        return self.zobrist
+
+    def digest(self):
+        """Return a 64-bit hash of the cells not in the background state and
+        where they are (see occupied), in an order of their own, worked
+        out from scratch.  This takes time in proportion to the number
+        of cells occupied (or, for packed maps, of all the cells)."""
+        coordinates, states = self.occupied()
+        columns = tuple(coordinates) + (states,)
+        if numpy is not None:
+            columns = [numpy.asarray(x, numpy.int64) for x in columns]
+            order = numpy.lexsort(columns[-2::-1])
+            data = numpy.stack(columns, 1)[order].tobytes()
+        else:
+            cells = sorted(zip(*[values(x) for x in columns]))
+            data = array.array('q', [int(x) for cell in cells 
+                                     for x in cell]).tobytes()
+        digest = hashlib.blake2b(data, digest_size=8).digest()
+        return int.from_bytes(digest, 'little')
+
+    def rehash(self, index, state):
+        """Update the hash for the cell at the given index changing to the
+        given state."""
+        base = index*self.keyStates
+        self.zobrist ^= (self.keys[base + int(self.buffer[index])] ^ 
+                         self.keys[base + int(state)])
+
+    def rehashed(self, indices, buffer):
+        """Return what the hash would be if the cells at the given indices
+        were in the states they are in in the given buffer."""
+        zobrist = self.fingerprint()
+        if self.dtype is not None:
+            indices = numpy.asarray(indices, numpy.intp)
+            keys = self.keyArray()
+            changes = (keys[indices, self.buffer[indices]] ^ 
+                       keys[indices, buffer[indices]])
+            return zobrist ^ int(numpy.bitwise_xor.reduce(changes, 
+                                                          initial=0))
+        keys, states, current = self.keys, self.keyStates, self.buffer
+        for index in indices:
+            base = index*states
+            zobrist ^= keys[base + current[index]] ^ keys[base + buffer[index]]
+        return zobrist
+
+    def index(self, address):
+        """Return the index of a (normalized) address into the buffer,
+        which holds the cells in a single flat list, last coordinate
+        varying fastest, followed by one more entry holding the border
+        state (for addresses which cannot be normalized)."""
+        raise NotImplementedError
+
+    def addresses(self):
+        """Return an iterator over all the (normalized) addresses, in the
+        order of their indices."""
+        return itertools.product(*[range(x) for x in self.size])
+
+    def viewport(self):
+        """Return an iterator over the addresses in the viewport."""
+        ranges = []
+        for start, length in zip(self.origin, self.size):
+            ranges.append(range(start, start + length))
+        return itertools.product(*ranges)
+
+    def clear(self):
+        """Reset every cell to the background."""
+        for address in self.addresses():
+            self.reset(address)
+
+    def dump(self):
+        """Return the cells as a tuple of simple values (including the
+        contents of the buffer as raw bytes) for a checkpoint; see
+        Automaton.checkpoint."""
+        buffer = self.buffer
+        if isinstance(buffer, int):
+            length = -(-buffer.bit_length()//8)
+            return 'int', self.dtype, buffer.to_bytes(length, 'little')
+        elif numpy is not None and isinstance(buffer, numpy.ndarray):
+            return 'array', self.dtype, buffer.dtype.str, buffer.tobytes()
+        else:
+            values = array.array('q')
+            try:
+                values.extend(buffer)
+            except TypeError:
+                # Not all the states are integers.
+                values = array.array('d', buffer)
+            return 'list', self.dtype, values.typecode, values.tobytes()
+
+    def load(self, record):
+        """Restore the cells from a tuple made by dump."""
+        kind, dtype = record[:2]
+        if kind == 'int':
+            self.buffer = int.from_bytes(record[2], 'little')
+        elif kind == 'array':
+            buffer = numpy.frombuffer(record[3], numpy.dtype(record[2]))
+            self.buffer = buffer.copy()
+        else:
+            values = array.array(record[2])
+            values.frombytes(record[3])
+            self.buffer = values.tolist()
+        self.dtype = dtype
+        self.zobrist = None
+
+    def dumpSlabs(self):
+        """Return the cells for a checkpoint as a record like dump's and an
+        iterator over any cells it leaves out, as raw bytes, a slab at a
+        time (so that a map too large for memory can be written out a
+        piece at a time); for most maps, the record holds them all."""
+        return self.dump(), iter(())
+
+    def loadSlabs(self, record, read):
+        """Restore the cells from what dumpSlabs returned; read(count)
+        returns the next count bytes of the slabs."""
+        self.load(record)
+
+    def occupied(self):
+        """Return the cells not in the background state, as a tuple of
+        sequences (lists or arrays) of their coordinates, one for each
+        axis, and a sequence of their states."""
+        if self.dtype is not None or self.packed:
+            cells = self.array()
+            coordinates = numpy.nonzero(cells != self.background)
+            return coordinates, cells[coordinates]
+        coordinates = [[] for x in range(self.dimension)]
+        states = []
+        for address in self.addresses():
+            state = self.get(address)
+            if state != self.background:
+                for axis, x in zip(coordinates, address):
+                    axis.append(x)
+                states.append(state)
+        return tuple(coordinates), states
+
+    def place(self, coordinates, states):
+        """Set the cells at the given coordinates (a sequence of them for
+        each axis, as for occupied) to the given states all at once;
+        the addresses are normalized first."""
+        if self.flat and self.dtype is not None:
+            coordinates = [numpy.asarray(x) for x in coordinates]
+            if self.normalize((-1,) + self.zero[1:]) is None:
+                for x, length in zip(coordinates, self.size):
+                    assert ((x >= 0) & (x < length)).all()
+            else:
+                coordinates = [x % length 
+                               for x, length in zip(coordinates, self.size)]
+            self.array()[tuple(coordinates)] = numpy.asarray(states)
+            self.zobrist = None
+            return
+        coordinates = [values(x) for x in coordinates]
+        for address, state in zip(zip(*coordinates), values(states)):
+            address = self.normalize(address)
+            assert address is not None
+            self.set(address, state)
+
+    def compact(self, dtype):
+        """Move the cells into a contiguous NumPy array of the given type
+        instead of a list of Python integers.  The layout of the buffer
+        is unchanged, so get, set, clone and swapping buffers all work
+        as before."""
+        assert numpy is not None
+        self.buffer = numpy.array(self.buffer, dtype)
+        self.dtype = self.buffer.dtype
+
+    def array(self):
+        """Return a view of a compact buffer shaped like the topology, so
+        that the cells can be operated on as a whole."""
+        assert self.dtype is not None
+        return self.buffer[:self.cells].reshape(self.size)
+
+    def padded(self, radius):
+        """Return a copy of a compact buffer, shaped like the topology and
+        padded on every side by radius cells of whatever lies beyond the
+        edges (the border, or the cells wrapped around from the other
+        side), so that the neighbors of every cell can be sliced out of
+        it at once."""
+        return self.pad(self.array(), radius)
+
+    def paddedRows(self, start, stop, radius):
+        """Return the part of what padded would return that is needed for
+        the rows (along the first coordinate) from start up to (but not
+        including) stop, reading only those rows, and the radius rows
+        on either side of them, from the buffer."""
+        rows = numpy.arange(start - radius, stop + radius)
+        block = numpy.take(self.array(), rows, 0, mode='wrap')
+        if self.normalize((-1,) + self.zero[1:]) is None:
+            # The rows beyond the edges are border, not wrapped around.
+            block[(rows < 0) | (rows >= self.size[0])] = self.border
+        padded = self.pad(block, radius)
+        return padded[radius:len(padded) - radius]
+
+    def pad(self, array, radius):
+        """Pad an array of cells as padded does the buffer.  The array is
+        shaped like the topology, with possibly some leading axes (say,
+        for a stack of several maps) which are left alone."""
+        raise NotImplementedError
+
+    def padding(self, array, radius):
+        """Return the widths numpy.pad needs to pad an array for pad."""
+        leading = array.ndim - self.dimension
+        return [(0, 0)]*leading + [(radius, radius)]*self.dimension
+
     def center(self):
         """A cell that's roughly in the center of the topology."""
-        address = [divmod(x, 2)[0] for x in self.size]
+        address = [o + divmod(x, 2)[0] for o, x in zip(self.origin, self.size)]
         return tuple(address)
 
     def random(self):
         """Create a random valid (normalized) address in this topology."""
         address = list(map(random.randrange, self.size))
-        return tuple(address)
+        return tuple(map(operator.add, self.origin, address))
 
     def clone(self):
         """Make a morphologically identical copy (with perhaps a different
@@ -98,11 +412,12 @@ class LineTopology(Topology):
     
     dimension = 1
     border = 0
+    flat = 1
 
     def __init__(self, size):
         Topology.__init__(self, size)
         self.length, = size
-        self.buffer = [self.background] * self.length
+        self.buffer = [self.background] * self.length + [self.border]
 
     def normalize(self, address):
         x, = address
@@ -110,18 +425,30 @@ class LineTopology(Topology):
             return None
         return address
 
+    def index(self, address):
+        x, = address
+        return x
+
     def get(self, address):
         result = self.normalize(address)
         if result is None:
             return self.border
         x, = result
-        return self.buffer[x]
+        if self.dtype is None:
+            return self.buffer[x]
+        return self.buffer.item(x)
 
     def set(self, address, state):
         x, = address
         assert x >= 0 and x < self.length
+        if self.zobrist is not None:
+            self.rehash(x, state)
         self.buffer[x] = state
 
+    def pad(self, array, radius):
+        return numpy.pad(array, self.padding(array, radius), 'constant', 
+                         constant_values=self.border)
+
 
 class CircleTopology(LineTopology):
 
@@ -144,7 +471,12 @@ class CircleTopology(LineTopology):
 
     def get(self, address):
         x, = self.normalize(address)
-        return self.buffer[x]
+        if self.dtype is None:
+            return self.buffer[x]
+        return self.buffer.item(x)
+
+    def pad(self, array, radius):
+        return numpy.pad(array, self.padding(array, radius), 'wrap')
 
 
 class GridTopology(Topology):
@@ -154,13 +486,12 @@ class GridTopology(Topology):
     
     dimension = 2
     border = 0
+    flat = 1
     
     def __init__(self, size):
         Topology.__init__(self, size)
         self.width, self.height = size
-        self.buffer = []
-        for x in range(self.width):
-            self.buffer.append([self.background] * self.height)
+        self.buffer = [self.background] * self.cells + [self.border]
 
     def normalize(self, address):
         x, y = address
@@ -169,18 +500,31 @@ class GridTopology(Topology):
             return None
         return address
 
+    def index(self, address):
+        x, y = address
+        return x*self.height + y
+
     def get(self, address):
         result = self.normalize(address)
         if result is None:
             return self.border
         x, y = result
-        return self.buffer[x][y]
+        if self.dtype is None:
+            return self.buffer[x*self.height + y]
+        return self.buffer.item(x*self.height + y)
     
     def set(self, address, state):
         x, y = address
         assert (x >= 0 and x < self.width and 
                 y >= 0 and y < self.height)
-        self.buffer[x][y] = state
+        index = x*self.height + y
+        if self.zobrist is not None:
+            self.rehash(index, state)
+        self.buffer[index] = state
+
+    def pad(self, array, radius):
+        return numpy.pad(array, self.padding(array, radius), 'constant', 
+                         constant_values=self.border)
 
 
 class ToroidTopology(GridTopology):
@@ -209,7 +553,872 @@ class ToroidTopology(GridTopology):
 
     def get(self, address):
         x, y = self.normalize(address)
-        return self.buffer[x][y]
+        if self.dtype is None:
+            return self.buffer[x*self.height + y]
+        return self.buffer.item(x*self.height + y)
+
+    def pad(self, array, radius):
+        return numpy.pad(array, self.padding(array, radius), 'wrap')
+
+
+class MappedGridTopology(GridTopology):
+
+    """A two-dimensional, bounded topology whose buffer is a file on
+    disk, mapped into memory (with numpy.memmap) as an array of the
+    given type, so that grids larger than memory can be run; the
+    cells are stored row after row, so that sweeping through them in
+    order reads the file in order.  With no filename, a temporary file
+    is used (and deleted once the map is).  The mode is that of
+    numpy.memmap:  'w+' creates (or overwrites) the file, 'r+' opens
+    an existing one.  A clone is mapped to the other of a pair of files,
+    the second named after the first with '.work' appended (see
+    workFilename).  A synchronous automaton swaps the buffers of its
+    map and work map every generation, so the file holding the map's
+    cells alternates between the two; current says which one it is.
+    Checkpoints write and read the cells a slab at a time.  Neighbor states are read through neighbors and
+    get rather than a table of neighbor indices, which would take
+    several times the memory of the cells themselves."""
+
+    dimension = 2
+    mapped = 1
+    indexed = 0
+    slab = 1 << 22 # the most cells copied at once
+
+    def __init__(self, size, filename=None, dtype=None, mode='w+'):
+        assert numpy is not None
+        Topology.__init__(self, size)
+        self.width, self.height = size
+        if dtype is None:
+            dtype = numpy.uint8
+        self.filename = filename
+        if filename is None:
+            file = tempfile.NamedTemporaryFile(prefix='cage')
+            self.buffer = numpy.memmap(file, dtype, mode, 
+                                       shape=(self.cells + 1,))
+            file.close()
+        else:
+            self.buffer = numpy.memmap(filename, dtype, mode, 
+                                       shape=(self.cells + 1,))
+        self.dtype = self.buffer.dtype
+        if mode == 'w+':
+            if self.background:
+                self.buffer[:self.cells] = self.background
+            self.buffer[self.cells] = self.border
+
+    def workFilename(self):
+        """The name of the file for a clone to map, or None:  the other of
+        the pair, so that a map opened from the work file (as current
+        may name) is cloned to the original file rather than to a third
+        one.  Since a clone's clone is mapped to the map's own file,
+        only clone a map which isn't itself a clone."""
+        if self.filename is None:
+            return None
+        if self.filename.endswith('.work'):
+            return self.filename[:-len('.work')]
+        return self.filename + '.work'
+
+    def current(self):
+        """The name of the file now holding the cells (either the one the
+        map was created with or its workFilename, depending on how many
+        times the buffers have been swapped), or None if it is a
+        temporary file.  To carry on from where a run left off, flush
+        the map and open this file with mode 'r+'."""
+        if self.filename is None:
+            return None
+        return self.buffer.filename
+
+    def compact(self, dtype):
+        # The cells are mapped from the file as they are.
+        pass
+
+    def flush(self):
+        """Write any changes out to the file."""
+        self.buffer.flush()
+
+    def load(self, record):
+        # Write the cells into the file already mapped, rather than
+        # replacing it with a copy in memory.
+        kind, dtype = record[:2]
+        assert kind == 'array'
+        self.buffer[...] = numpy.frombuffer(record[3], numpy.dtype(record[2]))
+        self.zobrist = None
+
+    def dumpSlabs(self):
+        record = 'mapped', self.dtype, self.buffer.dtype.str
+        def slabs():
+            for start in range(0, len(self.buffer), self.slab):
+                yield self.buffer[start:start + self.slab].tobytes()
+        return record, slabs()
+
+    def loadSlabs(self, record, read):
+        if record[0] != 'mapped':
+            self.load(record)
+            return
+        dtype = numpy.dtype(record[2])
+        for start in range(0, len(self.buffer), self.slab):
+            stop = min(start + self.slab, len(self.buffer))
+            data = read((stop - start)*dtype.itemsize)
+            self.buffer[start:stop] = numpy.frombuffer(data, dtype)
+        self.zobrist = None
+
+
+class MappedToroidTopology(MappedGridTopology, ToroidTopology):
+
+    """A two-dimensional, unbounded topology mapped from a file, where the
+    edges wrap around as in ToroidTopology."""
+
+    dimension = 2
+
+    def __init__(self, size, filename=None, dtype=None, mode='w+'):
+        MappedGridTopology.__init__(self, size, filename, dtype, mode)
+
+
+class PlaneTopology(Topology):
+
+    """A two-dimensional, unbounded topology which stretches off
+    forever in every direction.  Cells are stored in square chunks,
+    held in a dictionary keyed by chunk coordinates; a chunk exists
+    only while it holds some cell that is not in the background state,
+    so the memory and time taken grow with the live region rather than
+    its extent.  The size is that of the viewport.  Rules must leave
+    cells surrounded by background as background, and neighbors must
+    lie within a chunk's length of a cell."""
+
+    dimension = 2
+    chunk = 64
+    sparse = 1
+
+    def __init__(self, size):
+        Topology.__init__(self, size)
+        self.width, self.height = size
+        self.buffer = {}
+
+    def normalize(self, address):
+        return address
+
+    def get(self, address):
+        x, y = address
+        cx, x = divmod(x, self.chunk)
+        cy, y = divmod(y, self.chunk)
+        chunk = self.buffer.get((cx, cy))
+        if chunk is None:
+            return self.background
+        return chunk[x*self.chunk + y]
+
+    def set(self, address, state):
+        x, y = address
+        cx, x = divmod(x, self.chunk)
+        cy, y = divmod(y, self.chunk)
+        chunk = self.buffer.get((cx, cy))
+        if chunk is None:
+            if state == self.background:
+                return
+            chunk = [self.background] * (self.chunk*self.chunk)
+            self.buffer[cx, cy] = chunk
+        chunk[x*self.chunk + y] = state
+
+    def chunks(self):
+        """Return the sorted list of the coordinates of every chunk in use,
+        along with the chunks around them (into which the live region
+        might grow)."""
+        chunks = set()
+        for cx, cy in self.buffer:
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    chunks.add((cx + dx, cy + dy))
+        return sorted(chunks)
+
+    def addresses(self):
+        for cx, cy in self.chunks():
+            for x in range(cx*self.chunk, (cx + 1)*self.chunk):
+                for y in range(cy*self.chunk, (cy + 1)*self.chunk):
+                    yield x, y
+
+    def clear(self):
+        self.buffer = {}
+
+    def compact(self, dtype):
+        # Chunks are only allocated where they are needed anyway.
+        pass
+
+    def dump(self):
+        chunks = []
+        for key in sorted(self.buffer):
+            values = array.array('q', self.buffer[key])
+            chunks.append((key, values.tobytes()))
+        return 'chunks', self.origin, chunks
+
+    def load(self, record):
+        kind, self.origin, chunks = record
+        self.buffer = {}
+        for key, data in chunks:
+            values = array.array('q')
+            values.frombytes(data)
+            self.buffer[key] = values.tolist()
+
+    def occupied(self):
+        if numpy is None:
+            return Topology.occupied(self)
+        empty = numpy.zeros(0, numpy.int64)
+        xs, ys, states = [empty], [empty], [empty]
+        for (cx, cy), chunk in self.buffer.items():
+            cells = numpy.array(chunk).reshape(self.chunk, self.chunk)
+            x, y = numpy.nonzero(cells != self.background)
+            xs.append(x + cx*self.chunk)
+            ys.append(y + cy*self.chunk)
+            states.append(cells[x, y])
+        return ((numpy.concatenate(xs), numpy.concatenate(ys)), 
+                numpy.concatenate(states))
+
+
+class LatticeTopology(Topology):
+
+    """A bounded topology of any dimensionality consisting of a
+    rectangular block of cells; the dimensionality is taken from the
+    size."""
+
+    border = 0
+    flat = 1
+
+    def __init__(self, size):
+        self.dimension = len(size)
+        Topology.__init__(self, size)
+        self.strides = []
+        stride = 1
+        for length in reversed(size):
+            self.strides.insert(0, stride)
+            stride *= length
+        self.buffer = [self.background] * self.cells + [self.border]
+
+    def normalize(self, address):
+        for x, length in zip(address, self.size):
+            if x < 0 or x >= length:
+                return None
+        return address
+
+    def index(self, address):
+        index = 0
+        for x, stride in zip(address, self.strides):
+            index += x*stride
+        return index
+
+    def get(self, address):
+        result = self.normalize(address)
+        if result is None:
+            return self.border
+        if self.dtype is None:
+            return self.buffer[self.index(result)]
+        return self.buffer.item(self.index(result))
+
+    def set(self, address, state):
+        assert self.normalize(address) is not None
+        index = self.index(address)
+        if self.zobrist is not None:
+            self.rehash(index, state)
+        self.buffer[index] = state
+
+    def pad(self, array, radius):
+        return numpy.pad(array, self.padding(array, radius), 'constant', 
+                         constant_values=self.border)
+
+
+class TorusTopology(LatticeTopology):
+
+    """An unbounded topology of any dimensionality consisting of a
+    rectangular block of cells, each edge of which wraps around to the
+    opposite one."""
+
+    def __init__(self, size):
+        LatticeTopology.__init__(self, size)
+
+    def normalize(self, address):
+        return tuple([x % length for x, length in zip(address, self.size)])
+
+    def pad(self, array, radius):
+        return numpy.pad(array, self.padding(array, radius), 'wrap')
+
+
+def shiftBits(words, shift):
+    """Given a two-dimensional array of 64-bit words, each row of which
+    holds a string of bits (least significant bit of the first word
+    first), return the array of rows whose bit i is bit i + shift of
+    the original row, or zero if there is no such bit."""
+    quotient, remainder = divmod(shift, 64)
+    result = numpy.zeros_like(words)
+    for offset in (quotient, quotient + 1):
+        moved = numpy.zeros_like(words)
+        count = words.shape[1]
+        if 0 <= offset < count:
+            moved[:, :count - offset] = words[:, offset:]
+        elif -count < offset < 0:
+            moved[:, -offset:] = words[:, :count + offset]
+        if offset == quotient:
+            result |= moved >> numpy.uint64(remainder)
+        elif remainder:
+            result |= moved << numpy.uint64(64 - remainder)
+    return result
+
+
+class PackedLineTopology(LineTopology):
+
+    """A one-dimensional, bounded topology for two-state automata which
+    packs the whole line into a single Python integer, bit x holding
+    cell x, so that the line can be processed with bitwise operations
+    on the integer with no dependencies at all."""
+
+    dimension = 1
+    packed = 1
+    flat = 0
+
+    def __init__(self, size):
+        Topology.__init__(self, size)
+        self.length, = size
+        self.mask = (1 << self.length) - 1
+        if self.background:
+            self.buffer = self.mask
+        else:
+            self.buffer = 0
+
+    def get(self, address):
+        result = self.normalize(address)
+        if result is None:
+            return self.border
+        x, = result
+        return (self.buffer >> x) & 1
+
+    def set(self, address, state):
+        x, = address
+        assert x >= 0 and x < self.length
+        if state:
+            self.buffer |= 1 << x
+        else:
+            self.buffer &= ~(1 << x)
+
+    def compact(self, dtype):
+        # The cells are already as compact as they will get.
+        pass
+
+    def array(self):
+        """Return the cells unpacked into an array; unlike with compact
+        buffers, this is a copy."""
+        bytes = self.buffer.to_bytes(-(-self.length//8), 'little')
+        bits = numpy.unpackbits(numpy.frombuffer(bytes, numpy.uint8), 
+                                bitorder='little')
+        return bits[:self.length]
+
+    def shifted(self, dx):
+        """Return the line shifted so that each cell holds the state of
+        the cell dx (which is -1, 0 or 1) away from it."""
+        if dx < 0:
+            return ((self.buffer << 1) | (self.border & 1)) & self.mask
+        elif dx > 0:
+            return (self.buffer >> 1) | ((self.border & 1) << (self.length - 1))
+        return self.buffer
+
+
+class PackedCircleTopology(PackedLineTopology, CircleTopology):
+
+    """A one-dimensional, unbounded topology packed into a single Python
+    integer, where the ends wrap around as in CircleTopology."""
+
+    dimension = 1
+
+    def __init__(self, size):
+        PackedLineTopology.__init__(self, size)
+
+    def get(self, address):
+        x, = self.normalize(address)
+        return (self.buffer >> x) & 1
+
+    def shifted(self, dx):
+        buffer = self.buffer
+        if dx < 0:
+            return ((buffer << 1) | (buffer >> (self.length - 1))) & self.mask
+        elif dx > 0:
+            return (buffer >> 1) | ((buffer & 1) << (self.length - 1))
+        return buffer
+
+
+class PackedGridTopology(GridTopology):
+
+    """A two-dimensional, bounded topology for two-state automata
+    which packs the cells into 64-bit words, one bit per cell, so that
+    whole words of cells can be processed with bitwise operations.
+    Each column of the grid is stored as a run of words."""
+
+    dimension = 2
+    packed = 1
+    flat = 0
+
+    def __init__(self, size):
+        assert numpy is not None
+        Topology.__init__(self, size)
+        self.width, self.height = size
+        self.words = -(-self.height//64)
+        self.buffer = numpy.zeros(self.width*self.words, numpy.uint64)
+        if self.background:
+            self.buffer[...] = self.ones()
+
+    def ones(self):
+        """Return the words of a column with every cell set."""
+        ones = numpy.full(self.words, ~numpy.uint64(0))
+        if self.height % 64:
+            ones[-1] = (1 << (self.height % 64)) - 1
+        return ones
+
+    def get(self, address):
+        result = self.normalize(address)
+        if result is None:
+            return self.border
+        x, y = result
+        return (self.buffer.item(x*self.words + (y >> 6)) >> (y & 63)) & 1
+
+    def set(self, address, state):
+        x, y = address
+        assert (x >= 0 and x < self.width and 
+                y >= 0 and y < self.height)
+        index = x*self.words + (y >> 6)
+        word = self.buffer.item(index)
+        if state:
+            word |= 1 << (y & 63)
+        else:
+            word &= ~(1 << (y & 63))
+        self.buffer[index] = word
+
+    def compact(self, dtype):
+        # The cells are already as compact as they will get.
+        pass
+
+    def array(self):
+        """Return the cells unpacked into an array shaped like the
+        topology; unlike with compact buffers, this is a copy."""
+        words = self.buffer.reshape(self.width, self.words)
+        bytes = words.astype('<u8').view(numpy.uint8)
+        bits = numpy.unpackbits(bytes, axis=1, bitorder='little')
+        return bits[:, :self.height]
+
+    def place(self, coordinates, states):
+        xs, ys = [numpy.asarray(x) for x in coordinates]
+        if self.normalize((-1, 0)) is None:
+            assert ((xs >= 0) & (xs < self.width)).all()
+            assert ((ys >= 0) & (ys < self.height)).all()
+        else:
+            xs = xs % self.width
+            ys = ys % self.height
+        bits = numpy.zeros((self.width, self.words*64), numpy.uint8)
+        bits[:, :self.height] = self.array()
+        bits[xs, ys] = numpy.asarray(states) != 0
+        bytes = numpy.packbits(bits, axis=1, bitorder='little')
+        self.buffer = bytes.view('<u8').astype(numpy.uint64).reshape(-1)
+
+    def shiftColumns(self, words, dx):
+        """Return the columns of words as seen from dx columns over."""
+        result = numpy.zeros_like(words)
+        if self.border:
+            result[...] = self.ones()
+        if dx >= 0:
+            result[:self.width - dx] = words[dx:]
+        else:
+            result[-dx:] = words[:self.width + dx]
+        return result
+
+    def shiftRows(self, words, dy):
+        """Return the columns of words as seen from dy rows over."""
+        result = shiftBits(words, dy)
+        if self.border:
+            result |= ~shiftBits(words*0 + self.ones(), dy) & self.ones()
+        return result
+
+    def shifted(self, offset):
+        """Return the packed words holding, for every cell, the state of
+        the cell at the given offset from it."""
+        dx, dy = offset
+        words = self.buffer.reshape(self.width, self.words)
+        return self.shiftRows(self.shiftColumns(words, dx), dy)
+
+
+class PackedToroidTopology(PackedGridTopology, ToroidTopology):
+
+    """A two-dimensional, unbounded topology which packs the cells into
+    64-bit words, where the edges wrap around as in ToroidTopology."""
+
+    dimension = 2
+
+    def __init__(self, size):
+        PackedGridTopology.__init__(self, size)
+
+    def shiftColumns(self, words, dx):
+        return numpy.roll(words, -dx, 0)
+
+    def shiftRows(self, words, dy):
+        result = shiftBits(words, dy)
+        if dy > 0:
+            result |= shiftBits(words, dy - self.height)
+        elif dy < 0:
+            result |= shiftBits(words, dy + self.height)
+        result[:, -1] &= self.ones()[-1]
+        return result
+
+
+class Node:
+
+    """A node of a HashLife quadtree: either a single cell (at level 0,
+    where the population is the cell's state), or a square of 2**level
+    cells on a side made up of four quadrants one level down.  Nodes
+    are canonical (see HashLifeTopology.join), so two nodes are the
+    same object exactly when they hold the same cells."""
+
+    __slots__ = ('nw', 'ne', 'sw', 'se', 'level', 'population')
+
+    def __init__(self, nw, ne, sw, se, level, population):
+        self.nw, self.ne, self.sw, self.se = nw, ne, sw, se
+        self.level = level
+        self.population = population
+
+
+class HashLifeTopology(Topology):
+
+    """A two-dimensional, unbounded topology for two-state automata,
+    held as a quadtree of canonical (hash-consed) nodes, so that
+    identical regions of the plane, wherever and whenever they occur,
+    are stored once.  The size given is just a viewport (for center,
+    random, and players); cells can be read and written anywhere.  The
+    capacity is the number of nodes kept before unreachable nodes are
+    garbage collected (see collect)."""
+
+    dimension = 2
+
+    def __init__(self, size, capacity=1000000):
+        Topology.__init__(self, size)
+        self.width, self.height = size
+        self.capacity = capacity
+        self.nodes = {}
+        self.results = {}
+        self.leaves = [Node(None, None, None, None, 0, 0), 
+                      Node(None, None, None, None, 0, 1)]
+        self.empties = [self.leaves[0]]
+        self.root = self.empty(3)
+
+    def join(self, nw, ne, sw, se):
+        """Return the canonical node with the given quadrants."""
+        key = nw, ne, sw, se
+        node = self.nodes.get(key)
+        if node is None:
+            population = (nw.population + ne.population + 
+                          sw.population + se.population)
+            node = Node(nw, ne, sw, se, nw.level + 1, population)
+            self.nodes[key] = node
+        return node
+
+    def empty(self, level):
+        """Return the empty node of the given level."""
+        while len(self.empties) <= level:
+            below = self.empties[-1]
+            self.empties.append(self.join(below, below, below, below))
+        return self.empties[level]
+
+    def centre(self, node):
+        """Return the node one level down at the center of the node."""
+        return self.join(node.nw.se, node.ne.sw, node.sw.ne, node.se.nw)
+
+    def expand(self):
+        """Double the root in each direction, keeping it centered on the
+        origin."""
+        root = self.root
+        empty = self.empty(root.level - 1)
+        self.root = self.join(self.join(empty, empty, empty, root.nw), 
+                              self.join(empty, empty, root.ne, empty), 
+                              self.join(empty, root.sw, empty, empty), 
+                              self.join(root.se, empty, empty, empty))
+
+    def contains(self, address):
+        """Does the root hold the address?"""
+        half = 1 << (self.root.level - 1)
+        x, y = address
+        return -half <= x < half and -half <= y < half
+
+    def normalize(self, address):
+        return address
+
+    def dump(self):
+        """The nodes reachable from the root are numbered, the two leaves
+        first and then the rest with each after its quadrants, and
+        stored as the numbers of their quadrants."""
+        numbers = {self.leaves[0]: 0, self.leaves[1]: 1}
+        quadrants = array.array('q')
+        stack = [self.root]
+        while stack:
+            node = stack[-1]
+            if node in numbers:
+                stack.pop()
+                continue
+            children = node.nw, node.ne, node.sw, node.se
+            pending = [x for x in children if x not in numbers]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            numbers[node] = len(numbers)
+            quadrants.extend([numbers[x] for x in children])
+        return 'tree', self.origin, quadrants.tobytes()
+
+    def load(self, record):
+        kind, self.origin, data = record
+        quadrants = array.array('q')
+        quadrants.frombytes(data)
+        nodes = list(self.leaves)
+        for i in range(0, len(quadrants), 4):
+            nw, ne, sw, se = quadrants[i:i + 4]
+            nodes.append(self.join(nodes[nw], nodes[ne], nodes[sw], nodes[se]))
+        self.root = nodes[-1]
+
+    def get(self, address):
+        if not self.contains(address):
+            return self.background
+        x, y = address
+        node = self.root
+        half = 1 << (node.level - 1)
+        x += half
+        y += half
+        while node.level:
+            half = 1 << (node.level - 1)
+            if y < half:
+                if x < half:
+                    node = node.nw
+                else:
+                    node = node.ne
+                    x -= half
+            else:
+                y -= half
+                if x < half:
+                    node = node.sw
+                else:
+                    node = node.se
+                    x -= half
+        return node.population
+
+    def set(self, address, state):
+        while not self.contains(address):
+            self.expand()
+        x, y = address
+        half = 1 << (self.root.level - 1)
+        self.root = self.put(self.root, x + half, y + half, state)
+
+    def put(self, node, x, y, state):
+        """Return a node like the given one, but with the cell at x, y
+        (counted from its corner) set to the state."""
+        if not node.level:
+            return self.leaves[state and 1]
+        half = 1 << (node.level - 1)
+        nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+        if y < half:
+            if x < half:
+                nw = self.put(nw, x, y, state)
+            else:
+                ne = self.put(ne, x - half, y, state)
+        else:
+            if x < half:
+                sw = self.put(sw, x, y - half, state)
+            else:
+                se = self.put(se, x - half, y - half, state)
+        return self.join(nw, ne, sw, se)
+
+    def population(self):
+        """Return the number of live cells."""
+        return self.root.population
+
+    def mask(self, node, memo):
+        """Return the cells of a node of at most level 3 as the bits of an
+        integer, bit 8*y + x holding the cell at x, y (counted from its
+        corner).  The masks of nodes already seen are kept in memo."""
+        result = memo.get(node)
+        if result is None:
+            if not node.level:
+                result = node.population
+            else:
+                half = 1 << (node.level - 1)
+                result = (self.mask(node.nw, memo) | 
+                          self.mask(node.ne, memo) << half | 
+                          self.mask(node.sw, memo) << 8*half | 
+                          self.mask(node.se, memo) << 9*half)
+            memo[node] = result
+        return result
+
+    def unmask(self, mask, level, memo):
+        """Return the node of the given level (at most 3) holding the cells
+        of a mask, laid out as for mask.  The nodes of masks already
+        seen are kept in memo."""
+        key = mask, level
+        node = memo.get(key)
+        if node is None:
+            if not level:
+                node = self.leaves[mask & 1]
+            else:
+                half = 1 << (level - 1)
+                square = 0
+                for row in range(half):
+                    square |= ((1 << half) - 1) << 8*row
+                node = self.join(self.unmask(mask & square, level - 1, memo), 
+                          self.unmask(mask >> half & square, level - 1, memo), 
+                          self.unmask(mask >> 8*half & square, level - 1, memo), 
+                          self.unmask(mask >> 9*half & square, level - 1, memo))
+            memo[key] = node
+        return node
+
+    def occupied(self):
+        """The tree is walked down to the blocks of 8x8 cells with anything
+        in them, and the cells of all the blocks unpacked at once.  With
+        NumPy, the walk goes a level at a time, visiting only the
+        distinct nodes of each level, and keeping track of where each
+        is in arrays."""
+        memo = {}
+        half = 1 << (self.root.level - 1)
+        if numpy is None:
+            xs, ys = [], []
+            stack = [(self.root, -half, -half)]
+            while stack:
+                node, x, y = stack.pop()
+                if not node.population:
+                    continue
+                if node.level == 3:
+                    mask = self.mask(node, memo)
+                    for bit in range(64):
+                        if mask >> bit & 1:
+                            xs.append(x + (bit & 7))
+                            ys.append(y + (bit >> 3))
+                    continue
+                half = 1 << (node.level - 1)
+                stack.extend(((node.nw, x, y), (node.ne, x + half, y), 
+                              (node.sw, x, y + half), 
+                              (node.se, x + half, y + half)))
+            return (xs, ys), [1]*len(xs)
+        nodes = [self.root]
+        ids = numpy.zeros(int(self.root.population > 0), numpy.intp)
+        xs = numpy.full(len(ids), -half, numpy.int64)
+        ys = numpy.full(len(ids), -half, numpy.int64)
+        for level in range(self.root.level, 3, -1):
+            # The quadrants of each distinct node, by their index among
+            # the distinct nodes of the level below (or -1 if empty).
+            below = {}
+            quadrants = []
+            for node in nodes:
+                for quadrant in node.nw, node.ne, node.sw, node.se:
+                    if quadrant.population:
+                        quadrants.append(below.setdefault(quadrant, len(below)))
+                    else:
+                        quadrants.append(-1)
+            quadrants = numpy.array(quadrants, numpy.intp).reshape(-1, 4)[ids]
+            half = 1 << (level - 1)
+            xs = xs[:, None] + numpy.array([0, half, 0, half])
+            ys = ys[:, None] + numpy.array([0, 0, half, half])
+            live = quadrants >= 0
+            xs, ys, ids = xs[live], ys[live], quadrants[live]
+            nodes = list(below)
+        masks = [self.mask(node, memo) for node in nodes]
+        masks = numpy.array(masks, numpy.uint64).astype('<u8')[ids]
+        bits = numpy.unpackbits(masks.view(numpy.uint8).reshape(-1, 8), 
+                                axis=1, bitorder='little')
+        blocks, bit = numpy.nonzero(bits)
+        xs = xs[blocks] + (bit & 7)
+        ys = ys[blocks] + (bit >> 3)
+        return (xs, ys), numpy.ones(len(xs), numpy.uint8)
+
+    def place(self, coordinates, states):
+        if numpy is None or self.root.population:
+            Topology.place(self, coordinates, states)
+            return
+        live = numpy.asarray(states) != 0
+        xs, ys = [numpy.asarray(x, numpy.int64)[live] for x in coordinates]
+        if len(xs):
+            self.build(xs, ys)
+
+    def build(self, xs, ys):
+        """Replace the cells with the live cells at the given columns and
+        rows (as NumPy arrays).  The cells are gathered into masks of
+        8x8 blocks at once, and the tree built up from the blocks one
+        level at a time, joining only the distinct nodes at each level,
+        so that the work done follows the size of the tree rather than
+        the number of cells."""
+        extent = max(-min(xs.min(), ys.min()), max(xs.max(), ys.max()) + 1)
+        level = 3
+        while 1 << (level - 1) < extent:
+            level += 1
+        half = 1 << (level - 1)
+        xs = xs + half
+        ys = ys + half
+        bits = numpy.left_shift(numpy.uint64(1), 
+                                ((ys & 7) << 3 | (xs & 7)).astype(numpy.uint64))
+        xs >>= 3
+        ys >>= 3
+        order = numpy.lexsort((ys, xs))
+        xs, ys = xs[order], ys[order]
+        new = numpy.r_[True, (numpy.diff(xs) != 0) | (numpy.diff(ys) != 0)]
+        starts = numpy.flatnonzero(new)
+        masks = numpy.bitwise_or.reduceat(bits[order], starts)
+        masks, ids = numpy.unique(masks, return_inverse=True)
+        memo = {}
+        nodes = [self.unmask(mask, 3, memo) for mask in masks.tolist()]
+        xs, ys, ids = xs[starts], ys[starts], ids.reshape(-1)
+        for current in range(3, level):
+            # Each node is known by its index in the list of distinct
+            # nodes of its level; the empty node is added at the end.
+            empty = len(nodes)
+            nodes.append(self.empty(current))
+            quadrants = (ys & 1)*2 + (xs & 1)
+            xs >>= 1
+            ys >>= 1
+            order = numpy.lexsort((ys, xs))
+            xs, ys, quadrants, ids = (xs[order], ys[order], 
+                                      quadrants[order], ids[order])
+            new = numpy.r_[True, (numpy.diff(xs) != 0) | (numpy.diff(ys) != 0)]
+            parents = numpy.cumsum(new) - 1
+            children = numpy.full((parents[-1] + 1, 4), empty)
+            children[parents, quadrants] = ids
+            children, ids = numpy.unique(children, axis=0, return_inverse=True)
+            nodes = [self.join(*[nodes[x] for x in quadrants]) 
+                     for quadrants in children.tolist()]
+            xs, ys, ids = xs[new], ys[new], ids.reshape(-1)
+        self.root = nodes[ids[0]]
+
+    def compact(self, dtype):
+        # Identical regions are already shared.
+        pass
+
+    def collect(self, live=()):
+        """Discard every node not reachable from the root or from any of
+        the nodes in the given lists (those still in use partway through
+        advancing the root), along with the memoized results of the
+        nodes discarded, if there are more nodes than the capacity.  If
+        the nodes still in use are more than the capacity, MemoryError
+        is raised.  (If they come close to it, each collection frees
+        little, and they come often.)"""
+        if len(self.nodes) <= self.capacity:
+            return
+        nodes = {}
+        pending = [self.root] + self.empties
+        for row in live:
+            pending.extend(row)
+        while pending:
+            node = pending.pop()
+            if not node.level:
+                continue
+            key = node.nw, node.ne, node.sw, node.se
+            if key not in nodes:
+                nodes[key] = node
+                pending.extend(key)
+        if len(nodes) > self.capacity:
+            raise MemoryError("%d HashLife nodes in use, more than the "
+                              "capacity of %d" % (len(nodes), self.capacity))
+        self.nodes = nodes
+        results = {}
+        for key, result in self.results.items():
+            node = key[0]
+            if (nodes.get((node.nw, node.ne, node.sw, node.se)) is node and 
+                (not result.level or 
+                 nodes.get((result.nw, result.ne, result.sw, result.se)) is 
+                 result)):
+                results[key] = result
+        self.results = results
 
 #
 # Neighborhood
@@ -239,10 +1448,134 @@ class Neighborhood:
         raise NotImplementedError
 
     # Support functions for doing computations on neighborhoods; these need
-    # not be overridden.
+    # not be overridden.  Maps with flat buffers build a table of the
+    # indices of each cell's neighbors the first time one is needed, and
+    # thereafter read the neighbors' states straight out of the buffer.
+
+    uniform = 0 # whether every cell's neighbors lie at the same offsets
+    adjacency = None
+    adjacencyWidth = None
+    dependents = None
+    dependentStarts = None
+
+    def tabulate(self):
+        """Build the table of neighbor indices:  a flat array of integers
+        (32-bit ones, unless the map is too large for them) holding, for
+        each cell index in turn, the buffer indices of its neighbors
+        (adjacencyWidth of them), with wrapping already resolved and
+        neighbors beyond a border pointing at the border entry at the
+        end of the buffer.  With NumPy, the table is built for all the
+        cells at once from the offsets, if the neighborhood is uniform;
+        otherwise neighbors is called for every cell."""
+        border = self.cells
+        code = indexCode(self.cells + 1)
+        if numpy is not None and self.isUniform():
+            offsets = numpy.array(self.offsets(), numpy.int64)
+            self.adjacencyWidth = len(offsets)
+            offsets = offsets.reshape(len(offsets), self.dimension)
+            size = numpy.array(self.size, numpy.int64)
+            cells = numpy.indices(self.size, numpy.int64).reshape(self.dimension, 
+                                                                  -1).T
+            # Fill the table in place, through an array sharing its memory.
+            self.adjacency = array.array(code, [border])*(self.cells*len(offsets))
+            table = numpy.frombuffer(self.adjacency, code)
+            table = table.reshape(self.cells, len(offsets))
+            wraps = self.normalize((-1,) + self.zero[1:]) is not None
+            for column, offset in enumerate(offsets):
+                neighbors = cells + offset
+                if wraps:
+                    neighbors %= size
+                    table[:, column] = numpy.ravel_multi_index(neighbors.T, 
+                                                               self.size)
+                else:
+                    inside = ((neighbors >= 0) & (neighbors < size)).all(1)
+                    table[inside, column] = numpy.ravel_multi_index(
+                        neighbors[inside].T, self.size)
+            return
+        self.adjacencyWidth = self.neighborhood()
+        adjacency = array.array(code)
+        for address in self.addresses():
+            indices = self.neighborIndices(address)
+            assert len(indices) == self.adjacencyWidth
+            adjacency.extend(indices)
+        self.adjacency = adjacency
+
+    def isUniform(self):
+        """Do the neighbors of every cell lie at the same offsets?  Only if
+        the class which defines neighbors says so with the uniform
+        attribute, so that a subclass overriding neighbors isn't taken
+        to be uniform unless it says so too."""
+        for klass in type(self).__mro__:
+            if 'neighbors' in klass.__dict__:
+                return klass.__dict__.get('uniform', 0)
+        return 0
+
+    def neighborIndices(self, address):
+        """Return the buffer indices of the neighbors of a (normalized)
+        address, that of the border entry standing for any beyond an
+        edge."""
+        indices = []
+        for neighbor in self.neighbors(address):
+            neighbor = self.normalize(neighbor)
+            if neighbor is None:
+                indices.append(self.cells)
+            else:
+                indices.append(self.index(neighbor))
+        return indices
+
+    def tabulateDependents(self):
+        """Build the inverse of the table of neighbor indices:  a flat
+        array of the indices of the cells which count each cell among
+        their neighbors (and so might change when it does), cell by
+        cell, those for the cell at index being from
+        dependentStarts[index] up to dependentStarts[index + 1]."""
+        if self.adjacency is None:
+            self.tabulate()
+        width = self.adjacencyWidth
+        code = self.adjacency.typecode
+        startCode = indexCode(len(self.adjacency) + 1)
+        if numpy is not None:
+            # Sorting the table by neighbor groups the positions in it of
+            # each cell's dependents (the border, last, is left out).
+            neighbors = numpy.frombuffer(self.adjacency, code)
+            order = numpy.argsort(neighbors, kind='stable')
+            counts = numpy.bincount(neighbors, minlength=self.cells + 1)
+            counts = counts[:self.cells]
+            self.dependents = array.array(code, [0])*int(counts.sum())
+            dependents = numpy.frombuffer(self.dependents, code)
+            numpy.floor_divide(order[:len(dependents)], width, out=dependents, 
+                               casting='unsafe')
+            self.dependentStarts = array.array(startCode, [0])*(self.cells + 1)
+            starts = numpy.frombuffer(self.dependentStarts, startCode)
+            numpy.cumsum(counts, out=starts[1:])
+            return
+        lists = [[] for i in range(self.cells)]
+        for position, neighbor in enumerate(self.adjacency):
+            if neighbor < self.cells:
+                lists[neighbor].append(position//width)
+        self.dependents = array.array(code)
+        self.dependentStarts = array.array(startCode, [0])
+        for owners in lists:
+            self.dependents.extend(owners)
+            self.dependentStarts.append(len(self.dependents))
 
     def states(self, address):
         """Return the list of cell values for all neighbors."""
+        if self.flat and self.indexed:
+            if self.adjacency is None:
+                self.tabulate()
+            normalized = self.normalize(address)
+            if normalized is not None:
+                width = self.adjacencyWidth
+                start = self.index(normalized)*width
+                indices = self.adjacency[start:start + width]
+                buffer = self.buffer
+                # The border may have been changed since the buffer (and
+                # its border entry) was made.
+                buffer[self.cells] = self.border
+                if self.dtype is None:
+                    return [buffer[i] for i in indices]
+                return [buffer.item(i) for i in indices]
         return [self.get(x) for x in self.neighbors(address)]
 
     def inclusiveStates(self, address):
@@ -252,12 +1585,11 @@ class Neighborhood:
 
     def sum(self, address):
         """Sum the states of the neighboring cells."""
-        return reduce(operator.add, self.states(address))
+        return sum(self.states(address))
 
     def inclusiveSum(self, address):
         """Sum the states of the neighboring cells as well as this one."""
-        states = self.states(address)
-        return reduce(operator.add, states) + self.get(address)
+        return sum(self.states(address)) + self.get(address)
 
     def average(self, address):
         """The average of the neighbors' states."""
@@ -269,75 +1601,199 @@ class Neighborhood:
 
     def hasZero(self, address):
         """Do any neighbors have zero state?"""
-        for neighbor in self.neighbors(address):
-            if self.get(neighbor) == 0:
-                return 1
-        return 0
+        return 0 in self.states(address)
 
     def countZero(self, address):
         """Count the number of neighbors with state zero."""
-        count = 0
-        for neighbor in self.neighbors(address):
-            if self.get(neighbor) == 0:
-                count += 1
-        return count
+        return self.states(address).count(0)
 
     def hasNonZero(self, address):
         """Do any neighbors have nonzero state?"""
-        for neighbor in self.neighbors(address):
-            if self.get(neighbor) != 0:
-                return 1
-        return 0
+        states = self.states(address)
+        return states.count(0) < len(states)
 
     def countNonZero(self, address):
         """Count the number of neighbors with state zero."""
-        count = 0
-        for neighbor in self.neighbors(address):
-            if self.get(neighbor) != 0:
-                count += 1
-        return count
+        states = self.states(address)
+        return len(states) - states.count(0)
 
     def hasWith(self, address, state):
         """Do any neighbors have the given state?"""
-        for neighbor in self.neighbors(address):
-            if self.get(neighbor) == state:
-                return 1
-        return 0
+        return state in self.states(address)
 
     def countWith(self, address, state):
         """Count the number of neighbors with given state."""
-        count = 0
-        for neighbor in self.neighbors(address):
-            if self.get(neighbor) == state:
-                count += 1
-        return count
+        return self.states(address).count(state)
 
     def findFirstWith(self, address, state):
         """Finds index (into neighbor list) of first neighbor with given
         state, or None."""
-        neighbors = self.neighbors(address)
-        for i in range(len(neighbors)):
-            if self.get(neighbors[i]) == state:
-                return i
+        states = self.states(address)
+        if state in states:
+            return states.index(state)
         return None
 
     def findAllWith(self, address, state):
         """Return list of indexes of neighbors with the given state."""
-        found = []
-        neighbors = self.neighbors(address)
-        for i in range(len(neighbors)):
-            if self.get(neighbors[i]) == state:
-                found.append(i)
-        return found
+        states = self.states(address)
+        return [i for i in range(len(states)) if states[i] == state]
 
     def randomState(self, address):
         """Return a random neighbor's state."""
-        return self.get(random.choice(self.neighbors(address)))
+        return random.choice(self.states(address))
 
     def reduce(self, address, func, initial=0):
         """Do an arbitrary reduction of the states."""
         return reduce(func, self.states(address), initial)
 
+    # Support functions for operating on all cells at once, given a padded
+    # array from Topology.padded; these need not be overridden either.
+
+    def offsets(self):
+        """Return the offsets of the neighbors from any given cell."""
+        return self.neighbors(self.zero)
+
+    def reach(self):
+        """Return how far the furthest neighbor lies from a cell along any
+        one axis, which is how far an array needs to be padded."""
+        reach = 0
+        for offset in self.offsets():
+            for delta in offset:
+                reach = max(reach, abs(delta))
+        return reach
+
+    def view(self, padded, offset):
+        """Return a view of a padded array holding, for every cell, the
+        state of the cell at the given offset from it.  Any leading axes
+        of the array (see Topology.pad) are kept whole."""
+        reach = self.reach()
+        index = [Ellipsis]
+        for delta, length in zip(offset, padded.shape[-len(offset):]):
+            index.append(slice(reach + delta, length - reach + delta))
+        return padded[tuple(index)]
+
+    def views(self, padded):
+        """Return the list of views of a padded array for each neighbor,
+        in the same order as neighbors."""
+        return [self.view(padded, x) for x in self.offsets()]
+
+    def encode(self, padded, base, dtype):
+        """Return an array of the given type holding, for every cell, the
+        number whose digits in the given base are the states of the
+        cell and then each of its neighbors (in the order of
+        neighbors)."""
+        codes = self.view(padded, self.zero).astype(dtype)
+        for view in self.views(padded):
+            codes *= base
+            codes += view
+        return codes
+
+    # Counterparts of the support functions above which work on every cell
+    # of a compact map at once, each returning an array shaped like the
+    # topology (with an extra last axis for each neighbor, where noted).
+    # They work on the current state of the map, or on a padded array if
+    # one is given (say, the one passed to a field method).
+
+    def ensurePadded(self, padded=None):
+        """Return the given padded array, or pad the map if there is none."""
+        if padded is None:
+            padded = self.padded(self.reach())
+        return padded
+
+    def windowsAll(self, padded=None):
+        """Return, for every cell, the block of cells within reach of it
+        (centered on it), as a view of the padded array without copying
+        any cells; it has an extra axis for each dimension."""
+        padded = self.ensurePadded(padded)
+        shape = (2*self.reach() + 1,)*self.dimension
+        axes = tuple(range(-self.dimension, 0))
+        return numpy.lib.stride_tricks.sliding_window_view(padded, shape, 
+                                                           axes)
+
+    def statesAll(self, padded=None):
+        """The states of all the neighbors, along an extra last axis in the
+        order of neighbors."""
+        return numpy.stack(self.views(self.ensurePadded(padded)), -1)
+
+    def inclusiveStatesAll(self, padded=None):
+        """The states of all the neighbors, and then this one, along an
+        extra last axis."""
+        padded = self.ensurePadded(padded)
+        views = self.views(padded) + [self.view(padded, self.zero)]
+        return numpy.stack(views, -1)
+
+    def sumAll(self, padded=None):
+        """Sum the states of the neighboring cells."""
+        padded = self.ensurePadded(padded)
+        views = self.views(padded)
+        total = numpy.zeros(views[0].shape, numpy.int64)
+        for view in views:
+            total += view
+        return total
+
+    def inclusiveSumAll(self, padded=None):
+        """Sum the states of the neighboring cells as well as this one."""
+        padded = self.ensurePadded(padded)
+        return self.sumAll(padded) + self.view(padded, self.zero)
+
+    def averageAll(self, padded=None):
+        """The average of the neighbors' states."""
+        return self.sumAll(padded)/self.neighborhood()
+
+    def inclusiveAverageAll(self, padded=None):
+        """The average of the neighbors' state, including this ones."""
+        return self.inclusiveSumAll(padded)/(self.neighborhood() + 1)
+
+    def countWithAll(self, state, padded=None):
+        """Count the number of neighbors with given state."""
+        views = self.views(self.ensurePadded(padded))
+        count = numpy.zeros(views[0].shape, arrayType(len(views) + 1))
+        for view in views:
+            count += view == state
+        return count
+
+    def hasWithAll(self, state, padded=None):
+        """Do any neighbors have the given state?  (A Boolean array.)"""
+        return self.countWithAll(state, padded) > 0
+
+    def countZeroAll(self, padded=None):
+        """Count the number of neighbors with state zero."""
+        return self.countWithAll(0, padded)
+
+    def hasZeroAll(self, padded=None):
+        """Do any neighbors have zero state?"""
+        return self.countWithAll(0, padded) > 0
+
+    def countNonZeroAll(self, padded=None):
+        """Count the number of neighbors with nonzero state."""
+        return self.neighborhood() - self.countWithAll(0, padded)
+
+    def hasNonZeroAll(self, padded=None):
+        """Do any neighbors have nonzero state?"""
+        return self.countWithAll(0, padded) < self.neighborhood()
+
+    def findFirstWithAll(self, state, padded=None):
+        """The index (into the neighbor list) of the first neighbor with
+        the given state, or -1 where there is none."""
+        matches = self.findAllWithAll(state, padded)
+        return numpy.where(matches.any(-1), matches.argmax(-1), -1)
+
+    def findAllWithAll(self, state, padded=None):
+        """Which neighbors have the given state, as a Boolean array with an
+        extra last axis in the order of neighbors."""
+        return self.statesAll(padded) == state
+
+    def randomStateAll(self, padded=None):
+        """Return a random neighbor's state (chosen with NumPy's random
+        numbers rather than the random module's)."""
+        states = self.statesAll(padded)
+        choices = numpy.random.randint(0, states.shape[-1], states.shape[:-1])
+        return numpy.take_along_axis(states, choices[..., None], -1)[..., 0]
+
+    def reduceAll(self, ufunc, initial=0, padded=None):
+        """Do an arbitrary reduction of the states with a NumPy ufunc."""
+        return ufunc.reduce(self.statesAll(padded), -1, initial=initial)
+
 
 class NullNeighborhood(Neighborhood):
 
@@ -358,6 +1814,8 @@ class RadialNeighborhood(Neighborhood):
     """A one-dimensional neighborhood consisting of the cells to the
     left and right to a certain 'radius."""
     
+    uniform = 1
+
     def __init__(self, radius):
         Neighborhood.__init__(self)
         self.radius = radius
@@ -372,12 +1830,44 @@ class RadialNeighborhood(Neighborhood):
             result.append((x - i - 1,))
         return result
 
+    def windowSums(self, inclusive=1, padded=None):
+        """Return the sums of the neighbors of every cell (including the
+        cell itself, if inclusive), in order, as a list, or as an array
+        for compact maps (or for the cells of the given padded array,
+        say the one passed to a field method).  The sums are made by
+        sliding a window along the line (or from prefix sums, for
+        arrays), so the time taken per cell doesn't depend on the
+        radius."""
+        radius = self.radius
+        width = 2*radius + 1
+        if padded is not None or self.dtype is not None:
+            if padded is None:
+                padded = self.padded(radius)
+            padded = padded.astype(numpy.int64)
+            prefix = numpy.concatenate(([0], numpy.cumsum(padded)))
+            sums = prefix[width:] - prefix[:-width]
+            if not inclusive:
+                sums -= padded[radius:-radius]
+            return sums
+        states = [self.get((x,)) for x in range(-radius, self.length + radius)]
+        total = sum(states[:width])
+        sums = [total]
+        for x in range(1, self.length):
+            total += states[x + width - 1] - states[x - 1]
+            sums.append(total)
+        if not inclusive:
+            for x in range(self.length):
+                sums[x] -= states[x + radius]
+        return sums
+
 
 class VonNeumannNeighborhood(Neighborhood):
 
     """The von Neumann neighborhood.  A two-dimensional neighborhood
     consisting of the cells in the cardinal directions only."""
     
+    uniform = 1
+
     def __init__(self):
         Neighborhood.__init__(self)
     
@@ -397,6 +1887,8 @@ class MooreNeighborhood(Neighborhood):
     consisting of the cells in all eight cardinal and ordinal
     directions."""
     
+    uniform = 1
+
     def __init__(self):
         Neighborhood.__init__(self)
     
@@ -417,6 +1909,8 @@ class HexagonalNeighborhood(Neighborhood):
 
     """A two-dimensional, hexagonally-shaped neighborhood."""
     
+    uniform = 1
+
     def __init__(self):
         Neighborhood.__init__(self)
     
@@ -437,6 +1931,8 @@ class KnightsNeighborhood(Neighborhood):
     """A two-dimensional neighborhood encompassing all the legal moves
     of a knight in chess."""
     
+    uniform = 1
+
     def __init__(self):
         Neighborhood.__init__(self)
     
@@ -454,6 +1950,43 @@ class KnightsNeighborhood(Neighborhood):
                 (x - 1, y + 2)]
 
 
+class HyperMooreNeighborhood(Neighborhood):
+
+    """The Moore neighborhood generalized to any dimensionality:  all
+    the cells which differ from a cell by at most one along each axis
+    (26 of them in three dimensions)."""
+
+    uniform = 1
+
+    def __init__(self, dimension):
+        Neighborhood.__init__(self)
+        self.deltas = []
+        for delta in itertools.product((0, 1, -1), repeat=dimension):
+            if any(delta):
+                self.deltas.append(delta)
+
+    def neighborhood(self): return len(self.deltas)
+
+    def neighbors(self, address):
+        return [tuple(map(operator.add, address, x)) for x in self.deltas]
+
+
+class HyperVonNeumannNeighborhood(HyperMooreNeighborhood):
+
+    """The von Neumann neighborhood generalized to any dimensionality:
+    the cells one step away along each axis (6 of them in three
+    dimensions)."""
+
+    def __init__(self, dimension):
+        Neighborhood.__init__(self)
+        self.deltas = []
+        for axis in range(dimension):
+            for step in (1, -1):
+                delta = [0]*dimension
+                delta[axis] = step
+                self.deltas.append(tuple(delta))
+
+
 #
 # Map (Topology + Neighborhood mixing)
 #
@@ -506,6 +2039,31 @@ class MooreMap(ToroidTopology, MooreNeighborhood):
         return MooreMap(self.size)
 
 
+class MappedMooreMap(MappedToroidTopology, MooreNeighborhood):
+
+    """A two-dimensional Moore map mapped from a file."""
+
+    def __init__(self, size, filename=None, dtype=None, mode='w+'):
+        MappedToroidTopology.__init__(self, size, filename, dtype, mode)
+        MooreNeighborhood.__init__(self)
+
+    def clone(self):
+        return MappedMooreMap(self.size, self.workFilename(), self.dtype)
+
+
+class MappedVonNeumannMap(MappedToroidTopology, VonNeumannNeighborhood):
+
+    """A two-dimensional von Neumann map mapped from a file."""
+
+    def __init__(self, size, filename=None, dtype=None, mode='w+'):
+        MappedToroidTopology.__init__(self, size, filename, dtype, mode)
+        VonNeumannNeighborhood.__init__(self)
+
+    def clone(self):
+        return MappedVonNeumannMap(self.size, self.workFilename(), 
+                                   self.dtype)
+
+
 class KnightsMap(ToroidTopology, KnightsNeighborhood):
     
     """A standard two-dimensional, knight's neighborhood map."""
@@ -518,6 +2076,106 @@ class KnightsMap(ToroidTopology, KnightsNeighborhood):
         return KnightsMap(self.size)
 
 
+class HyperMooreMap(TorusTopology, HyperMooreNeighborhood):
+
+    """A toroidal Moore map of any dimensionality."""
+
+    def __init__(self, size):
+        TorusTopology.__init__(self, size)
+        HyperMooreNeighborhood.__init__(self, self.dimension)
+
+    def clone(self):
+        return HyperMooreMap(self.size)
+
+
+class HyperVonNeumannMap(TorusTopology, HyperVonNeumannNeighborhood):
+
+    """A toroidal von Neumann map of any dimensionality."""
+
+    def __init__(self, size):
+        TorusTopology.__init__(self, size)
+        HyperVonNeumannNeighborhood.__init__(self, self.dimension)
+
+    def clone(self):
+        return HyperVonNeumannMap(self.size)
+
+
+class MoorePlaneMap(PlaneTopology, MooreNeighborhood):
+
+    """An unbounded two-dimensional Moore map."""
+
+    def __init__(self, size):
+        PlaneTopology.__init__(self, size)
+        MooreNeighborhood.__init__(self)
+
+    def clone(self):
+        return MoorePlaneMap(self.size)
+
+
+class VonNeumannPlaneMap(PlaneTopology, VonNeumannNeighborhood):
+
+    """An unbounded two-dimensional von Neumann map."""
+
+    def __init__(self, size):
+        PlaneTopology.__init__(self, size)
+        VonNeumannNeighborhood.__init__(self)
+
+    def clone(self):
+        return VonNeumannPlaneMap(self.size)
+
+
+class PackedLineMap(PackedLineTopology, RadialNeighborhood):
+
+    """A one-dimensional line map for two-state automata, packed one bit
+    per cell."""
+
+    def __init__(self, size, radius):
+        PackedLineTopology.__init__(self, size)
+        RadialNeighborhood.__init__(self, radius)
+
+    def clone(self):
+        return PackedLineMap(self.size, self.radius)
+
+
+class PackedRadialMap(PackedCircleTopology, RadialNeighborhood):
+
+    """A one-dimensional radial map for two-state automata, packed one
+    bit per cell."""
+
+    def __init__(self, size, radius):
+        PackedCircleTopology.__init__(self, size)
+        RadialNeighborhood.__init__(self, radius)
+
+    def clone(self):
+        return PackedRadialMap(self.size, self.radius)
+
+
+class PackedMooreMap(PackedToroidTopology, MooreNeighborhood):
+
+    """A two-dimensional Moore map for two-state automata, packed one
+    bit per cell."""
+
+    def __init__(self, size):
+        PackedToroidTopology.__init__(self, size)
+        MooreNeighborhood.__init__(self)
+
+    def clone(self):
+        return PackedMooreMap(self.size)
+
+
+class HashLifeMap(HashLifeTopology, MooreNeighborhood):
+
+    """An unbounded two-dimensional Moore map held as a HashLife
+    quadtree."""
+
+    def __init__(self, size, capacity=1000000):
+        HashLifeTopology.__init__(self, size, capacity)
+        MooreNeighborhood.__init__(self)
+
+    def clone(self):
+        return HashLifeMap(self.size, self.capacity)
+
+
 
 #
 # Direction
@@ -672,7 +2330,7 @@ class CodedTotalisticRule:
     the rule for Conway's Game of Life would be 3/23."""
 
     def __init__(self, ruleCode):
-        if type(ruleCode) is bytes:
+        if isinstance(ruleCode, str):
             ruleCode = self.parseRule(ruleCode)
         self.populate(ruleCode)
 
@@ -712,6 +2370,56 @@ class CodedTotalisticRule:
     def rule(self, address):
         return self.table[self.map.get(address)][self.map.sum(address)]
 
+    def field(self, padded):
+        """Compute the next generation of every cell at once, summing the
+        neighbors as shifted views and looking the results up in the
+        table."""
+        states = self.map.view(padded, self.map.zero)
+        counts = numpy.zeros(states.shape, arrayType(len(self.table[0])))
+        for view in self.map.views(padded):
+            counts += view
+        table = numpy.array(self.table, self.map.dtype)
+        return table[states, counts]
+
+    def packedField(self):
+        """Compute the next generation of a packed map, 64 cells per
+        operation: the neighbors are added up into a bit-sliced count
+        (one word array per bit of the total), and the table is then
+        evaluated as a Boolean function of those bits."""
+        states = self.map.buffer.reshape(self.map.width, self.map.words)
+        rows = {}
+        planes = []
+        for dx, dy in self.map.offsets():
+            # Shifting across rows is the expensive part, so only do it
+            # once for each distinct row offset.
+            if dy not in rows:
+                rows[dy] = self.map.shiftRows(states, dy)
+            carry = self.map.shiftColumns(rows[dy], dx)
+            for plane in planes:
+                overflow = plane & carry
+                plane ^= carry
+                carry = overflow
+            if len(planes) < len(self.table[0]).bit_length():
+                planes.append(carry)
+        born = numpy.zeros_like(states)
+        stay = numpy.zeros_like(states)
+        for total in range(len(self.table[0])):
+            if not self.table[0][total] and not self.table[1][total]:
+                continue
+            match = ~numpy.zeros_like(states)
+            for bit in range(len(planes)):
+                if total & (1 << bit):
+                    match &= planes[bit]
+                else:
+                    match &= ~planes[bit]
+            if self.table[0][total]:
+                born |= match
+            if self.table[1][total]:
+                stay |= match
+        result = (born & ~states) | (stay & states)
+        result[:, -1] &= self.map.ones()[-1]
+        return result.reshape(-1)
+
 
 class LinearCodedRule(Rule):
 
@@ -744,6 +2452,26 @@ class LinearCodedRule(Rule):
         left, right, this = self.map.inclusiveStates(address)
         return self.table[left][this][right]
 
+    def packedField(self):
+        """Compute the next generation of a packed line all at once, as the
+        Boolean function given by the table of the lines shifted left
+        and right and the line itself."""
+        mask = self.map.mask
+        # The neighbor the rule calls left is the one at x + 1 (see
+        # RadialNeighborhood.neighbors).
+        right, this, left = [self.map.shifted(x) for x in (-1, 0, 1)]
+        notLeft, notRight = left ^ mask, right ^ mask
+        pairs = [[notLeft & notRight, notLeft & right], 
+                 [left & notRight, left & right]]
+        dead = alive = 0
+        for l in range(2):
+            for r in range(2):
+                if self.table[l][0][r]:
+                    dead |= pairs[l][r]
+                if self.table[l][1][r]:
+                    alive |= pairs[l][r]
+        return (this & alive) | (this ^ mask) & dead
+
 
 
 #
@@ -759,6 +2487,9 @@ class Automaton:
     independently of the cellular network."""
     
     states = None
+    hashes = None # the generations of the hashes seen, if detecting cycles
+    period = None # the period of the cycle, once one has been detected
+    transient = None # the generation at which the cycle was entered
     
     def __init__(self, map):
         if self.__class__ is Automaton:
@@ -776,12 +2507,172 @@ class Automaton:
         self.generation += 1
         for agent in self.agents:
             agent.update()
+        if self.hashes is not None:
+            self.record()
     
     def between(self):
         """Hook to do things between generations."""
         for agent in self.agents:
             agent.between()
 
+    def detectCycles(self, memory=65536):
+        """Start looking for cycles:  the hash of the map (see
+        Topology.hashKeys) is recorded after every generation, and as
+        soon as one repeats the generation at which the cycle was
+        entered and the period (1 for a fixed point) are stored in the
+        transient and period attributes.  Only the most recent memory
+        hashes are kept, so longer cycles are not noticed; collisions
+        between different maps are possible but unlikely."""
+        self.map.hashKeys(self.states)
+        self.memory = memory
+        self.period = self.transient = None
+        self.hashes = {self.map.fingerprint(): self.generation}
+
+    def record(self):
+        """Record the hash of the map for the current generation, checking
+        for a repeat."""
+        fingerprint = self.map.fingerprint()
+        seen = self.hashes.get(fingerprint)
+        if seen is not None:
+            if self.period is None:
+                self.transient, self.period = seen, self.generation - seen
+            return
+        if len(self.hashes) >= self.memory:
+            del self.hashes[next(iter(self.hashes))]
+        self.hashes[fingerprint] = self.generation
+
+    def settled(self):
+        """Has the automaton been detected to have entered a cycle?"""
+        return self.period is not None
+
+    # Checkpoints start with a signature and version number, followed by a
+    # compressed stream holding the length of a pickle of a dictionary of
+    # simple values, the pickle, and then any cells left out of it; the
+    # cells go in as raw bytes (see Topology.dumpSlabs).
+    SIGNATURE = b'CAGE'
+    VERSION = 2
+
+    def checkpoint(self, filename):
+        """Save the state of the automaton to the given file, from which it
+        can be restored later (even on another machine) to continue
+        exactly as it would have:  the cells, the generation and any
+        other simple attributes (numbers, strings, and None) of the
+        automaton, the agents, and the state of the random number
+        generators.  The file is replaced all at once, so that an
+        interruption never leaves a partial checkpoint behind."""
+        attributes = {}
+        for name, value in self.__dict__.items():
+            if isinstance(value, (int, float, str, type(None))):
+                attributes[name] = value
+        agents = []
+        for agent in self.agents:
+            state = agent.__dict__.copy()
+            del state['automaton']
+            agents.append((agent.__class__, state))
+        record, slabs = self.map.dumpSlabs()
+        state = {'attributes': attributes, 
+                 'map': record, 
+                 'agents': agents, 
+                 'random': random.getstate()}
+        if numpy is not None:
+            state['numpy'] = numpy.random.get_state()
+        data = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+        compressor = zlib.compressobj(1)
+        temporary = filename + '.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(self.SIGNATURE + struct.pack('<H', self.VERSION))
+            file.write(compressor.compress(struct.pack('<Q', len(data))))
+            file.write(compressor.compress(data))
+            for slab in slabs:
+                file.write(compressor.compress(slab))
+            file.write(compressor.flush())
+        os.replace(temporary, filename)
+
+    def restore(self, filename):
+        """Restore the state saved by checkpoint into this automaton, which
+        must have been created the same way as the original.  Only
+        restore checkpoints from trusted sources, since they contain
+        pickles."""
+        with open(filename, 'rb') as file:
+            header = file.read(len(self.SIGNATURE) + 2)
+            if header[:len(self.SIGNATURE)] != self.SIGNATURE:
+                raise ValueError("not a checkpoint: %s" % filename)
+            version, = struct.unpack('<H', header[len(self.SIGNATURE):])
+            if version != self.VERSION:
+                raise ValueError("unsupported checkpoint version: %d" % 
+                                 version)
+            decompressor = zlib.decompressobj()
+            pending = bytearray()
+            def read(count):
+                # Decompress only as much as is needed for the next count
+                # bytes, a block at a time.
+                while len(pending) < count:
+                    data = decompressor.unconsumed_tail or file.read(1 << 20)
+                    if not data:
+                        raise ValueError("truncated checkpoint: %s" % 
+                                         filename)
+                    pending.extend(decompressor.decompress(data, 1 << 22))
+                data = bytes(pending[:count])
+                del pending[:count]
+                return data
+            length, = struct.unpack('<Q', read(8))
+            state = pickle.loads(read(length))
+            self.__dict__.update(state['attributes'])
+            self.map.loadSlabs(state['map'], read)
+        self.agents = []
+        for agentClass, agentState in state['agents']:
+            agent = agentClass.__new__(agentClass)
+            agent.__dict__.update(agentState)
+            agent.automaton = self
+            self.agents.append(agent)
+        random.setstate(state['random'])
+        if 'numpy' in state and numpy is not None:
+            numpy.random.set_state(state['numpy'])
+        self.restored()
+
+    def restored(self):
+        """Hook to bring anything derived from the map up to date after it
+        has been restored."""
+        pass
+
+    def step(self, generations):
+        """Advance the automaton by the given number of generations (or
+        until it stops running) without anyone watching, and return the
+        number it advanced by.  Automata which can take several
+        generations at once more quickly than one by one override
+        this; they need only check running beforehand."""
+        for count in range(generations):
+            if not self.running():
+                return count
+            self.update()
+            self.between()
+        return generations
+
+    def run(self, generations=None, every=1, callback=None, until=None):
+        """Run the automaton for the given number of generations (or for
+        as long as it's running), stopping to observe it every so many
+        generations:  the callback, if any, is then called with the
+        automaton, and the run ends if the until predicate, if any,
+        returns true when called with it.  In between, the automaton
+        advances by step.  Returns the number of generations run."""
+        assert every > 0
+        done = 0
+        while generations is None or done < generations:
+            if not self.running():
+                break
+            count = every
+            if generations is not None:
+                count = min(count, generations - done)
+            count = self.step(count)
+            done += count
+            if callback is not None:
+                callback(self)
+            if until is not None and until(self):
+                break
+            if not count:
+                break
+        return done
+
     def add(self, agent):
         """Add an agent."""
         assert agent not in self.agents
@@ -792,12 +2683,130 @@ class Automaton:
         assert agent in self.agents
         self.agents.remove(agent)
 
+    def sweep(self, map):
+        """Apply the rule to every cell of the map, in index order, and
+        store the new states into the given map (which may be the map
+        itself).  Flat buffers are written directly, by index; when
+        cycles are being detected, the indices of the cells whose
+        states differ from those in the map are returned, so that the
+        hash can be kept up to date (otherwise None is returned)."""
+        if not map.flat:
+            for address in self.map.addresses():
+                map.set(address, self.rule(address))
+            return None
+        buffer = map.buffer
+        if self.hashes is None or map is self.map:
+            for index, address in enumerate(self.map.addresses()):
+                buffer[index] = self.rule(address)
+            return None
+        current = self.map.buffer
+        changed = []
+        for index, address in enumerate(self.map.addresses()):
+            state = self.rule(address)
+            if state != current[index]:
+                changed.append(index)
+            buffer[index] = state
+        return changed
+
+    def compact(self):
+        """Store the map in a NumPy array of the smallest integer type
+        that can hold all the states of this automaton."""
+        assert self.states is not None
+        signed = min(self.map.background, getattr(self.map, 'border', 0)) < 0
+        self.map.compact(arrayType(self.states, signed))
+
+    def compile(self, limit=1 << 20):
+        """Turn the rule into a lookup table, indexed by a code made up of
+        the states of a cell and each of its neighbors (as digits in
+        base states, the cell's own being the most significant), by
+        calling it once for every possible neighborhood on a probe copy
+        of the map (which holds only the cells of one neighborhood and
+        reads them with get); then compact the map and install a field method
+        which steps all the cells at once by computing their codes and
+        looking them up.  This only gives the same results as the rule
+        if the rule depends on nothing but the states of the cell and
+        its neighbors (see SynchronousAutomaton) and they are all valid
+        states.  The number of neighborhoods may not exceed the
+        limit."""
+        assert self.states is not None and self.map.flat
+        assert 0 <= getattr(self.map, 'border', 0) < self.states
+        offsets = self.map.offsets()
+        size = self.states**(len(offsets) + 1)
+        assert size <= limit
+        # The probe shares everything but the cells with the map; those of
+        # the neighborhood it needs are kept in a dictionary by index.
+        probe = copy.copy(self.map)
+        probe.buffer, probe.dtype, probe.indexed = {}, None, 0
+        probe.zobrist = probe.adjacency = probe.dependents = None
+        center = probe.center()
+        assert min(self.map.size) > 2*self.map.reach()
+        neighbors = [tuple(map(operator.add, center, x)) for x in offsets]
+        assert probe.neighbors(center) == neighbors
+        indices = [probe.index(probe.normalize(x)) 
+                   for x in [center] + neighbors]
+        buffer = probe.buffer
+        table = []
+        saved, self.map = self.map, probe
+        try:
+            for states in itertools.product(range(self.states), 
+                                            repeat=len(indices)):
+                for index, state in zip(indices, states):
+                    buffer[index] = state
+                table.append(self.rule(center))
+        finally:
+            self.map = saved
+        if self.map.dtype is None:
+            self.compact()
+        self.lookup = numpy.array(table, self.map.dtype)
+        self.field = self.lookupField
+
+    def lookupField(self, padded):
+        """Compute the next generation of every cell at once from the table
+        made by compile."""
+        codeType = arrayType(len(self.lookup))
+        return self.lookup[self.map.encode(padded, self.states, codeType)]
+
     # The rule function should be implemented here, but isn't so that mixin
     # Rule subclasses can be included without having to explicitly define
     # a rule method that calls a Rule.rule method.  The rule method should
     # have this signature:
     #
     #     def rule(self, address): ...
+    #
+    # Automata with compact maps can also provide a field method, which
+    # computes the whole next generation at once as an array (with the
+    # same results as calling rule for every cell) from the current one
+    # as padded by Topology.padded out to the reach of the neighborhood:
+    #
+    #     def field(self, padded): ...
+    #
+    # and likewise a packedField method for maps which are packed one bit
+    # per cell, returning the next generation's packed buffer:
+    #
+    #     def packedField(self): ...
+    #
+    # (The compile method above installs a field method for any suitable
+    # rule.)  These are only used where they go with the rule (see
+    # vectorized), so a subclass overriding rule isn't stepped with the
+    # field its parent inherited along with the parent's rule.
+
+    def vectorized(self, name):
+        """Return the whole-map method of the given name (field or
+        packedField), if the automaton has one that goes with its rule:
+        one installed on the automaton itself (say, by compile), or one
+        defined by the class which defines the rule, or by a subclass of
+        it.  Otherwise return None."""
+        if name in self.__dict__:
+            return self.__dict__[name]
+        ruler = None
+        for klass in type(self).__mro__:
+            if ruler is None and 'rule' in klass.__dict__:
+                ruler = klass
+            if name in klass.__dict__:
+                if ruler is None or issubclass(klass, ruler):
+                    return getattr(self, name)
+                return None
+        return None
 
 
 class AgentAutomaton(Automaton):
@@ -823,20 +2832,8 @@ class AsynchronousAutomaton(Automaton):
         Automaton.__init__(self, map)
 
     def update(self):
-        ### This should be generalized instead of going case by case.
-        if self.map.dimension == 1:
-            for x in range(self.map.length):
-                address = (x,)
-                newCell = self.rule(address)
-                self.map.set(address, newCell)
-        elif self.map.dimension == 2:
-            for x in range(self.map.width):
-                for y in range(self.map.height):
-                    address = x, y
-                    newCell = self.rule(address)
-                    self.map.set(address, newCell)
-        else:
-            raise NotImplementedError
+        self.sweep(self.map)
+        self.map.zobrist = None
         Automaton.update(self)
         
 
@@ -845,33 +2842,291 @@ class SynchronousAutomaton(Automaton):
     """A synchronous automaton updates all cells simultaneously (that
     is, during a given update, no state transition will affect the
     transition of any other cell).  This is probably the automaton you
-    want to start from."""
+    want to start from.
+
+    If the rule depends on nothing but the states of a cell and its
+    neighbors (no random numbers, no generation count, no agents),
+    setting the local attribute lets the automaton apply the rule only
+    to the cells at or next to the cells that changed in the previous
+    generation, carrying all the others over as they are.  Changes
+    made to the map other than by update are not noticed until the
+    changed attribute is reset to None, which forces a full pass.
+
+    The same sort of rule can also be spread over several processes
+    with the parallel method, and automata with a field method can
+    compute it in tiles on several threads with the threaded method
+    (see there)."""
+
+    local = 0
+    tile = 65536 # the number of cells in each tile when threaded
     
     def __init__(self, map):
         Automaton.__init__(self, map)
         self.workMap = map.clone()
+        if map.dtype is not None:
+            self.workMap.compact(map.dtype)
+        self.changed = None
+        self.addressList = None
+        self.processes = None
+        self.pool = None
+
+    def compact(self):
+        Automaton.compact(self)
+        self.workMap.compact(self.map.dtype)
 
     def update(self):
-        ### This should be generalized instead of going case by case.
-        if self.map.dimension == 1:
-            for x in range(self.map.length):
-                address = (x,)
-                newCell = self.rule(address)
-                self.workMap.set(address, newCell)
-        elif self.map.dimension == 2:
-            for x in range(self.map.width):
-                for y in range(self.map.height):
-                    address = x, y
-                    newCell = self.rule(address)
-                    self.workMap.set(address, newCell)
+        tracked = 0
+        changed = None
+        # When detecting cycles, a local automaton tracks changes even if it
+        # has a field, since it then knows which cells changed without
+        # comparing them all.
+        field = self.vectorized('field')
+        packedField = self.vectorized('packedField')
+        tracking = (self.local and self.map.flat and self.map.indexed and 
+                    (self.hashes is not None or field is None))
+        if self.map.packed and packedField is not None:
+            self.workMap.buffer = packedField()
+        elif self.map.dtype is not None and field is not None and \
+             not tracking:
+            if self.pool is None and not self.map.mapped:
+                padded = self.map.padded(self.map.reach())
+                self.workMap.array()[...] = field(padded)
+            else:
+                self.tiles()
+        elif self.processes:
+            self.distribute()
+        elif tracking:
+            self.track()
+            tracked = 1
         else:
-            raise NotImplementedError
+            if self.workMap.sparse:
+                # Not every cell is visited, so start from a clean slate.
+                self.workMap.clear()
+            changed = self.sweep(self.workMap)
+        if tracked:
+            changed = self.changed
+        else:
+            # Only tracking keeps the record of changed cells up to date.
+            self.changed = None
+        if self.hashes is not None and self.map.keys is not None:
+            # Bring the hash up to date from the cells that changed, rather
+            # than working it out again from every cell.  Only tracking
+            # and sweeps say which those are; for a field, finding them
+            # takes a pass over every cell.
+            if changed is None and self.map.dtype is not None:
+                cells = self.map.cells
+                changed = numpy.flatnonzero(self.workMap.buffer[:cells] != 
+                                            self.map.buffer[:cells])
+            if changed is None:
+                self.workMap.zobrist = None
+            else:
+                self.workMap.zobrist = self.map.rehashed(changed, 
+                                                         self.workMap.buffer)
         self.swap()
         Automaton.update(self)
 
+    def detectCycles(self, memory=65536):
+        Automaton.detectCycles(self, memory)
+        self.workMap.keys = self.map.keys
+        self.workMap.keyStates = self.map.keyStates
+
+    def restored(self):
+        # The work map's contents don't matter, but its type does (which a
+        # mapped work map keeps anyway).
+        if not self.workMap.mapped:
+            self.workMap.load(self.map.dump())
+        self.changed = None
+
+    def track(self):
+        """Update the work map, applying the rule only to cells which could
+        have changed, and record the indices of the cells which did."""
+        map = self.map
+        buffer, workBuffer = map.buffer, self.workMap.buffer
+        if self.changed is None:
+            self.sweep(self.workMap)
+            self.changed = [i for i in range(map.cells) 
+                            if workBuffer[i] != buffer[i]]
+            return
+        if map.dependents is None:
+            map.tabulateDependents()
+        if self.addressList is None:
+            self.addressList = list(map.addresses())
+        # The work map still holds the previous generation, which differs
+        # from the current one only at the cells that just changed.
+        candidates = set(self.changed)
+        dependents, starts = map.dependents, map.dependentStarts
+        for index in self.changed:
+            workBuffer[index] = buffer[index]
+            candidates.update(dependents[starts[index]:starts[index + 1]])
+        changed = []
+        addresses = self.addressList
+        for index in candidates:
+            state = self.rule(addresses[index])
+            if state != buffer[index]:
+                workBuffer[index] = state
+                changed.append(index)
+        self.changed = changed
+
     def swap(self):
         self.map.buffer, self.workMap.buffer = \
                          self.workMap.buffer, self.map.buffer
+        self.map.zobrist, self.workMap.zobrist = \
+                          self.workMap.zobrist, self.map.zobrist
+
+    def parallel(self, workers=None):
+        """Split the map into strips along its first coordinate and have
+        each of the given number of worker processes (by default, one
+        per CPU) apply the rule to one of them every generation.  The
+        map and work map buffers are moved into shared memory, so each
+        worker reads its strip's neighbors in the adjacent strips
+        directly and no cells are copied between processes; the workers
+        and the automaton meet at a barrier before and after each
+        generation, and the swap happens afterward as usual.  The
+        results are those of the compacted map in a single process,
+        provided that the rule depends only on the map and the
+        generation count (in particular, that it doesn't use random
+        numbers), and that the states are all integers (the buffers hold
+        the compacted type).  Agents and between stay in this process.
+        Workers are forked, so this is only available where fork is;
+        call close to stop them."""
+        assert multiprocessing is not None and numpy is not None
+        assert self.map.flat and not self.processes
+        if self.map.dtype is None:
+            # Compacting would truncate any states that aren't integers.
+            assert all(x == int(x) for x in self.map.buffer)
+            self.compact()
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        workers = max(1, min(workers, self.map.size[0]))
+        if self.map.adjacency is None and self.map.indexed:
+            # Build the table of neighbor indices before forking, so that
+            # the workers share it rather than each building its own.
+            self.map.tabulate()
+        context = multiprocessing.get_context('fork')
+        self.segments, self.buffers = [], []
+        for map in self.map, self.workMap:
+            segment = shared_memory.SharedMemory(create=True, 
+                                                 size=map.buffer.nbytes)
+            buffer = numpy.ndarray(map.buffer.shape, map.dtype, segment.buf)
+            buffer[...] = map.buffer
+            map.buffer = buffer
+            self.segments.append(segment)
+            self.buffers.append(buffer)
+        self.control = context.RawArray('l', 2)
+        self.barrier = context.Barrier(workers + 1)
+        processes = []
+        rows = self.map.size[0]
+        for i in range(workers):
+            start, stop = i*rows//workers, (i + 1)*rows//workers
+            process = context.Process(target=self.work, args=(start, stop))
+            process.daemon = True
+            process.start()
+            processes.append(process)
+        self.processes = processes
+
+    def threaded(self, workers=None, tile=None):
+        """Compute each generation with the field method in tiles (slabs
+        of whole rows along the first coordinate, each of about the
+        given number of cells, so that a tile's arrays stay in cache),
+        spreading them over a pool of the given number of threads (by
+        default, one per CPU).  NumPy releases the interpreter lock
+        while it works on arrays, so the tiles are computed in parallel;
+        the update waits for every tile before swapping.  Agents and
+        between stay on the calling thread.  Call close to stop the
+        threads."""
+        assert futures is not None and self.vectorized('field') is not None
+        assert self.pool is None
+        if self.map.dtype is None:
+            self.compact()
+        if tile is not None:
+            self.tile = tile
+        self.pool = futures.ThreadPoolExecutor(workers)
+
+    def tiles(self):
+        """Compute the field into the work map in tiles, on the thread pool
+        if there is one.  A map that is mapped from a file has each tile
+        padded on its own, so that it is never read into memory all at
+        once; any other is padded once, and the tiles sliced out of it."""
+        reach = self.map.reach()
+        field = self.vectorized('field')
+        result = self.workMap.array()
+        rows = self.map.size[0]
+        step = max(1, self.tile*rows//self.map.cells)
+        if self.map.mapped:
+            padded = None
+        else:
+            padded = self.map.padded(reach)
+        def compute(start):
+            stop = min(start + step, rows)
+            if padded is None:
+                block = self.map.paddedRows(start, stop, reach)
+            else:
+                block = padded[start:stop + 2*reach]
+            result[start:stop] = field(block)
+        starts = range(0, rows, step)
+        if self.pool is None:
+            for start in starts:
+                compute(start)
+        else:
+            # Going through the results waits for (and reraises any
+            # exceptions from) every tile.
+            for done in self.pool.map(compute, starts):
+                pass
+
+    def work(self, start, stop):
+        """The main loop of a worker process started by parallel, updating
+        the strip from the start row up to (but not including) the stop
+        row."""
+        rest = [range(x) for x in self.map.size[1:]]
+        addresses = list(itertools.product(range(start, stop), *rest))
+        first = start*(self.map.cells//self.map.size[0])
+        while 1:
+            self.barrier.wait()
+            generation, current = self.control
+            if generation < 0:
+                break
+            try:
+                self.generation = generation
+                self.map.buffer = self.buffers[current]
+                self.workMap.buffer = self.buffers[1 - current]
+                buffer = self.workMap.buffer
+                for index, address in enumerate(addresses, first):
+                    buffer[index] = self.rule(address)
+            except:
+                # Don't leave the others waiting for this worker forever.
+                self.barrier.abort()
+                raise
+            self.barrier.wait()
+
+    def distribute(self):
+        """Have the workers compute the next generation into the work
+        map and wait for them to finish."""
+        self.control[0] = self.generation
+        self.control[1] = self.map.buffer is not self.buffers[0]
+        self.barrier.wait()
+        self.barrier.wait()
+
+    def close(self):
+        """Stop the threads started by threaded or the worker processes
+        started by parallel (moving the buffers back out of shared
+        memory)."""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if not self.processes:
+            return
+        self.control[0] = -1
+        self.barrier.wait()
+        for process in self.processes:
+            process.join()
+        self.processes = None
+        self.map.buffer = self.map.buffer.copy()
+        self.workMap.buffer = self.workMap.buffer.copy()
+        self.buffers = None
+        for segment in self.segments:
+            segment.close()
+            segment.unlink()
+        self.segments = None
 
 
 class TwoStateAutomaton(SynchronousAutomaton):
@@ -918,13 +3173,205 @@ class ConwayAutomaton(TwoStateTotalisticAutomaton):
 class LinearCodedAutomaton(TwoStateAutomaton, LinearCodedRule):
 
     """A two-state, synchronous automaton with a linear coded rule
-    (r = 1, k = 1)."""
+    (r = 1, k = 1).  The line wraps around if wrap is set, and is
+    packed into a single integer (which is much faster) if packed is
+    set."""
 
-    def __init__(self, size, code):
-        TwoStateAutomaton.__init__(self, LineMap(size, 1))
+    def __init__(self, size, code, packed=0, wrap=0):
+        if packed:
+            mapClasses = PackedLineMap, PackedRadialMap
+        else:
+            mapClasses = LineMap, RadialMap
+        TwoStateAutomaton.__init__(self, mapClasses[wrap](size, 1))
         LinearCodedRule.__init__(self, code)
 
 
+class EnsembleAutomaton(Automaton):
+
+    """An ensemble automaton steps a collection of independent automata
+    (the members, typically surveying a space of rules) all at once.
+    Every member must have a map of the same class and size, and the
+    same number of states, and must be suitable for compiling (see
+    Automaton.compile); their maps are stacked into one array, with a
+    row per member, and each generation is computed for all of them
+    with one lookup into the stacked tables.  Members drop out (and
+    are left as they are) once they are no longer running.  The map of
+    the ensemble is that of the first member, and describes them
+    all."""
+
+    def __init__(self, members):
+        assert members
+        first = members[0]
+        Automaton.__init__(self, first.map)
+        self.members = members
+        self.states = first.states
+        for member in members:
+            assert member.states == self.states
+            assert member.map.__class__ is self.map.__class__
+            assert member.map.size == self.map.size
+            if getattr(member, 'lookup', None) is None:
+                member.compile()
+            assert member.map.dtype == self.map.dtype
+        self.tables = numpy.array([x.lookup for x in members])
+        self.stack = numpy.array([x.map.buffer for x in members])
+        # The members' maps are left as views of their rows in the stack,
+        # so that they can be displayed and examined as usual.
+        for member, row in zip(members, self.stack):
+            member.map.buffer = row
+
+    def running(self):
+        for member in self.members:
+            if member.running():
+                return 1
+        return 0
+
+    def update(self):
+        active = [x for x in range(len(self.members)) 
+                  if self.members[x].running()]
+        if active:
+            map = self.map
+            states = self.stack[active, :map.cells]
+            states = states.reshape((len(active),) + map.size)
+            padded = map.pad(states, map.reach())
+            codes = map.encode(padded, self.states, 
+                               arrayType(self.tables.shape[1]))
+            rows = numpy.array(active).reshape((-1,) + (1,)*map.dimension)
+            next = self.tables[rows, codes]
+            self.stack[active, :map.cells] = next.reshape(len(active), -1)
+            for x in active:
+                self.members[x].changed = None
+                self.members[x].map.zobrist = None
+                Automaton.update(self.members[x])
+        Automaton.update(self)
+
+    def between(self):
+        for member in self.members:
+            member.between()
+        Automaton.between(self)
+
+
+class HashLifeAutomaton(Automaton, CodedTotalisticRule):
+
+    """A two-state totalistic automaton on an unbounded Moore map,
+    evolved with Gosper's HashLife algorithm:  the result of advancing
+    each quadtree node is memoized, so that repetitive patterns can be
+    advanced by enormous numbers of generations at once.  The map's
+    capacity holds during a jump as well as between them:  the nodes
+    being worked on are kept live while the rest are collected.  While
+    cycles are being detected, step advances one generation at a time,
+    hashing the live cells (see Topology.digest) after each.  Rules
+    where empty cells are born (B0) are not supported."""
+
+    states = 2
+    DEAD, ALIVE = list(range(states))
+
+    def __init__(self, size, ruleCode, capacity=1000000):
+        Automaton.__init__(self, HashLifeMap(size, capacity))
+        CodedTotalisticRule.__init__(self, ruleCode)
+        assert not self.table[0][0], "B0 rules are not supported"
+        self.live = []
+
+    def update(self):
+        self.advance(0)
+        for agent in self.agents:
+            agent.update()
+        if self.hashes is not None:
+            self.record()
+
+    def step(self, generations):
+        # Cycles can only be detected generation by generation.
+        if self.agents or self.hashes is not None or not self.running():
+            return Automaton.step(self, generations)
+        # Take the largest jumps possible, one for each bit of the count.
+        for power in range(generations.bit_length() - 1, -1, -1):
+            if generations & (1 << power):
+                self.advance(power)
+        return generations
+
+    def advance(self, power):
+        """Advance the automaton by 2**power generations at once."""
+        map = self.map
+        self.live = []
+        map.collect()
+        # The root must be large enough that the pattern, wherever it
+        # can spread to in that time, stays within the result.
+        while (map.root.level < power + 3 or 
+               map.centre(map.centre(map.root)).population != 
+               map.root.population):
+            map.expand()
+        map.root = self.successor(map.root, power)
+        self.generation += 1 << power
+
+    def successor(self, node, power):
+        """Return the node one level down at the center of the given node
+        (of level 2 or higher), 2**power generations later."""
+        if not node.population:
+            return node.nw
+        key = node, power
+        result = self.map.results.get(key)
+        if result is not None:
+            return result
+        map = self.map
+        if node.level == 2:
+            result = self.base(node)
+        else:
+            nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+            grid = [[nw, map.join(nw.ne, ne.nw, nw.se, ne.sw), ne], 
+                    [map.join(nw.sw, nw.se, sw.nw, sw.ne), 
+                     map.centre(node), 
+                     map.join(ne.sw, ne.se, se.nw, se.ne)], 
+                    [sw, map.join(sw.ne, se.nw, sw.se, se.sw), se]]
+            quadrants = []
+            # Nodes may be collected from here on, so the ones made here
+            # (reachable from nothing else until the result is done) are
+            # kept live, the rows of the grid as they change.
+            frame = [[node]] + grid + [quadrants]
+            self.live.extend(frame)
+            map.collect(self.live)
+            if power == node.level - 2:
+                # The first half of the generations, at the next level
+                # down; the second half follows below.
+                power -= 1
+                for row in grid:
+                    for i in range(3):
+                        row[i] = self.successor(row[i], power)
+            else:
+                for row in grid:
+                    for i in range(3):
+                        row[i] = map.centre(row[i])
+            for y in range(2):
+                for x in range(2):
+                    quadrant = map.join(grid[y][x], grid[y][x + 1], 
+                                        grid[y + 1][x], grid[y + 1][x + 1])
+                    quadrants.append(self.successor(quadrant, power))
+            result = map.join(*quadrants)
+            del self.live[-len(frame):]
+        map.results[key] = result
+        return result
+
+    def base(self, node):
+        """Advance the central four cells of a level 2 node one
+        generation using the table."""
+        cells = [[0]*4 for i in range(4)]
+        for y in range(4):
+            for x in range(4):
+                quadrant = ((node.nw, node.ne), (node.sw, node.se))[y >> 1][x >> 1]
+                leaf = ((quadrant.nw, quadrant.ne), 
+                        (quadrant.sw, quadrant.se))[y & 1][x & 1]
+                cells[y][x] = leaf.population
+        quadrants = []
+        for y in (1, 2):
+            for x in (1, 2):
+                total = 0
+                for dy in (-1, 0, 1):
+                    for dx in (-1, 0, 1):
+                        total += cells[y + dy][x + dx]
+                total -= cells[y][x]
+                state = self.table[cells[y][x]][total]
+                quadrants.append(self.map.leaves[state])
+        return self.map.join(*quadrants)
+
+
 
 #
 # Initializer
@@ -964,63 +3411,105 @@ class PointInitializer(Initializer):
 class RandomInitializer(Initializer):
 
     """A random initializer sets all the cells in the network to some
-    random non-zero value with the specified frequency."""
+    random non-zero value with the specified frequency.  The values
+    are drawn from a generator of their own, seeded with the given
+    seed (or, if there is none, from the random module, so that
+    seeding that still makes runs repeatable); weights, if given, are
+    the relative frequencies of the non-zero states.  With NumPy, the
+    cells are drawn and written a block at a time."""
+
+    slab = 1 << 22 # the most cells drawn at once
     
-    def __init__(self, frequency=None):
+    def __init__(self, frequency=None, seed=None, weights=None):
         Initializer.__init__(self)
         self.frequency = frequency
+        self.seed = seed
+        self.weights = weights
 
     def initialize(self, automaton):
         states = automaton.states
         frequency = self.frequency
         if frequency is None:
             frequency = (states - 1.0)/states
-        ### This should be generalized instead of going case by case.
+        seed = self.seed
+        if seed is None:
+            seed = random.getrandbits(64)
         map = automaton.map
-        if map.dimension == 1:
-            for x in range(map.length):
-                if random.random() < frequency:
-                        map.set((x,), 
-                                random.randrange(automaton.states - 1) + 1)
-        elif map.dimension == 2:
-            for x in range(map.width):
-                for y in range(map.height):
-                    if random.random() < frequency:
-                        map.set((x, y), 
-                                random.randrange(automaton.states - 1) + 1)
-        else:
-            raise NotImplementedError
+        if numpy is None:
+            generator = random.Random(seed)
+            choices = list(range(1, states))
+            for address in map.viewport():
+                if generator.random() < frequency:
+                    state, = generator.choices(choices, self.weights)
+                    map.set(map.normalize(address), state)
+            return
+        generator = numpy.random.default_rng(seed)
+        choices = numpy.arange(1, states)
+        probabilities = None
+        if self.weights is not None:
+            probabilities = numpy.asarray(self.weights, float)
+            probabilities /= probabilities.sum()
+        # Draw a slab of rows at a time, writing compact maps straight into
+        # the buffer and placing the cells on any other.
+        direct = map.flat and map.dtype is not None and map.origin == map.zero
+        length = map.size[0]
+        rows = max(self.slab//(map.cells//length), 1)
+        for start in range(0, length, rows):
+            shape = (min(rows, length - start),) + tuple(map.size[1:])
+            chosen = generator.random(shape) < frequency
+            drawn = generator.choice(choices, int(chosen.sum()), 
+                                     p=probabilities)
+            if direct:
+                map.array()[start:start + len(chosen)][chosen] = drawn
+            else:
+                coordinates = [x + origin for x, origin in 
+                               zip(numpy.nonzero(chosen), map.origin)]
+                coordinates[0] += start
+                map.place(coordinates, drawn)
+        if direct:
+            map.zobrist = None
 
 
 class SeedInitializer(Initializer):
 
     """A seed initializer places count cells of the specific state in
-    random positions on the network."""
+    random positions on the network.  The positions are sampled all at
+    once, without replacement, with a generator seeded as for
+    RandomInitializer."""
     
-    def __init__(self, count, state=1):
+    def __init__(self, count, state=1, seed=None):
         Initializer.__init__(self)
         self.count = count
         self.state = state
+        self.seed = seed
 
     def initialize(self, automaton):
         map = automaton.map
         assert self.count < map.cells
-        seeds = []
-        for i in range(self.count):
-            while 1:
-                address = map.random()
-                if address in seeds:
-                    continue
-                map.set(address, self.state)
-                break
-            seeds.append(address)
+        seed = self.seed
+        if seed is None:
+            seed = random.getrandbits(64)
+        indices = random.Random(seed).sample(range(map.cells), self.count)
+        if numpy is not None:
+            coordinates = numpy.unravel_index(numpy.array(indices, numpy.intp), 
+                                              map.size)
+            coordinates = [x + origin 
+                           for x, origin in zip(coordinates, map.origin)]
+        else:
+            coordinates = [[] for x in range(map.dimension)]
+            for index in indices:
+                for axis in reversed(range(map.dimension)):
+                    index, x = divmod(index, map.size[axis])
+                    coordinates[axis].append(x + map.origin[axis])
+        map.place(coordinates, [self.state]*self.count)
 
 
 class PatternInitializer(Initializer):
 
     """A pattern initializer takes a (two-dimensional) pattern and
     grafts it ont to the network roughly in the center of the
-    topology."""
+    topology.  Patterns of rows all the same length are copied onto
+    compact maps as a single block."""
     
     def __init__(self, pattern):
         Initializer.__init__(self)
@@ -1030,6 +3519,10 @@ class PatternInitializer(Initializer):
         for y in range(self.height):
             if len(self.pattern[y]) > self.width:
                 self.width = len(self.pattern[y])
+        self.rectangular = 1
+        for row in self.pattern:
+            if len(row) != self.width:
+                self.rectangular = 0
 
     def initialize(self, automaton):
         map = automaton.map
@@ -1039,9 +3532,21 @@ class PatternInitializer(Initializer):
         assert self.width <= map.width and self.height <= map.height
         left = divmod(map.width - self.width, 2)[0]
         bottom = divmod(map.height - self.height, 2)[0]
+        if (numpy is not None and self.rectangular and 
+            map.flat and map.dtype is not None):
+            block = numpy.array(self.pattern, map.dtype).reshape(self.height, 
+                                                                 self.width)
+            map.array()[left:left + self.width, 
+                        bottom:bottom + self.height] = block.T
+            map.zobrist = None
+            return
+        xs, ys, states = [], [], []
         for y in range(self.height):
             for x in range(len(self.pattern[y])):
-                map.set((left + x, bottom + y), self.pattern[y][x])
+                xs.append(left + x)
+                ys.append(bottom + y)
+                states.append(self.pattern[y][x])
+        map.place((xs, ys), states)
 
 
 class StringInitializer(PatternInitializer):
@@ -1060,6 +3565,678 @@ class StringInitializer(PatternInitializer):
         PatternInitializer.__init__(self, pattern)
 
 
+class PatternFile(Initializer):
+
+    """A pattern file initializer reads a two-dimensional pattern from
+    a file in one of the standard formats, and places it on the
+    network with the top left corner of its bounding box at the given
+    offset (or roughly in the center of the viewport, if there is
+    none); save writes the cells of a map out in the same format.  The
+    cells are placed and gathered all at once (see Topology.place and
+    Topology.occupied), so this is fast for compact and HashLife maps
+    even for patterns of millions of cells."""
+
+    def __init__(self, filename, offset=None):
+        if self.__class__ is PatternFile:
+            raise NotImplementedError
+        Initializer.__init__(self)
+        self.filename = filename
+        self.offset = offset
+
+    def initialize(self, automaton):
+        map = automaton.map
+        assert map.dimension == 2
+        with open(self.filename) as file:
+            (xs, ys), states = self.read(file)
+        if not len(xs):
+            return
+        if numpy is not None:
+            xs = numpy.asarray(xs)
+            ys = numpy.asarray(ys)
+            left, top = int(xs.min()), int(ys.min())
+            width, height = int(xs.max()) - left + 1, int(ys.max()) - top + 1
+        else:
+            left, top = min(xs), min(ys)
+            width, height = max(xs) - left + 1, max(ys) - top + 1
+        offset = self.offset
+        if offset is None:
+            ox, oy = map.origin
+            offset = (ox + divmod(map.width - width, 2)[0], 
+                      oy + divmod(map.height - height, 2)[0])
+        dx, dy = offset[0] - left, offset[1] - top
+        if numpy is not None:
+            map.place((xs + dx, ys + dy), states)
+        else:
+            map.place(([x + dx for x in xs], [y + dy for y in ys]), states)
+
+    def save(self, map):
+        """Write the cells of the map to the file."""
+        assert map.dimension == 2
+        coordinates, states = map.occupied()
+        with open(self.filename, 'w') as file:
+            self.write(file, coordinates, states)
+
+    def read(self, file):
+        """Read the pattern from an open file, returning the cells not in
+        the background state as occupied does."""
+        raise NotImplementedError
+
+    def write(self, file, coordinates, states):
+        """Write cells, given as occupied returns them, to an open file."""
+        raise NotImplementedError
+
+
+class RLEFile(PatternFile):
+
+    """A run length encoded (RLE) pattern file:  after any comments
+    (starting with #) comes a header line giving the size of the
+    pattern (x = 3, y = 3, and perhaps a rule), and then runs of
+    cells, each an optional count followed by b (or .) for the
+    background, o for state 1, or, for patterns of more than two
+    states, A to X, pA to pX, and so on up to yO, for states 1 to
+    255; $ ends a row and ! the pattern.  The coordinates of the cells
+    written are relative to the corner of their bounding box.  With
+    NumPy, the runs are decoded and encoded all at once rather than
+    one at a time."""
+
+    token = re.compile(r'(\d*)([bo.$!]|[p-y]?[A-X])')
+    length = 70 # the longest line written
+
+    def read(self, file):
+        lines = []
+        for line in file:
+            if line.startswith('#'):
+                continue
+            if not lines and line.lstrip().startswith('x') and '=' in line:
+                continue
+            lines.append(line)
+        body = ''.join(lines)
+        if numpy is None:
+            return self.parse(body)
+        text = numpy.frombuffer(body.encode('ascii', 'replace'), numpy.uint8)
+        end = numpy.flatnonzero(text == ord('!'))
+        if len(end):
+            text = text[:end[0]]
+        digits = (text >= ord('0')) & (text <= ord('9'))
+        prefixes = (text >= ord('p')) & (text <= ord('y'))
+        letters = (text >= ord('A')) & (text <= ord('X'))
+        known = digits | prefixes | letters | numpy.isin(text, list(b'bo.$'))
+        text = text[known]
+        digits, prefixes, letters = digits[known], prefixes[known], letters[known]
+        # Each tag is preceded by its prefix, if it has one, and before
+        # that the digits of its count, if it has one.
+        tags = numpy.flatnonzero(~digits & ~prefixes)
+        before = tags - 1
+        prefixed = (before >= 0) & prefixes[numpy.maximum(before, 0)]
+        last = before - prefixed
+        positions = numpy.arange(len(text))
+        nondigits = numpy.maximum.accumulate(numpy.where(digits, -1, positions))
+        lengths = numpy.where(last >= 0, 
+                              last - nondigits[numpy.maximum(last, 0)], 0)
+        counts = numpy.zeros(len(tags), numpy.int64)
+        values = text.astype(numpy.int64) - ord('0')
+        for place in range(int(lengths.max(initial=0))):
+            within = lengths > place
+            counts[within] += values[last[within] - place]*10**place
+        counts[lengths == 0] = 1
+        codes = text[tags]
+        states = numpy.zeros(len(tags), numpy.int64)
+        states[codes == ord('o')] = 1
+        lettered = letters[tags]
+        states[lettered] = codes[lettered] - ord('A') + 1
+        states[prefixed] += (text[before[prefixed]].astype(numpy.int64) - 
+                             ord('p') + 1)*24
+        # Rows end at each $; columns count from the last one.
+        newlines = codes == ord('$')
+        rows = numpy.cumsum(numpy.where(newlines, counts, 0))
+        rows -= numpy.where(newlines, counts, 0)
+        advances = numpy.where(newlines, 0, counts)
+        ends = numpy.cumsum(advances)
+        previous = numpy.maximum.accumulate(numpy.where(newlines, 
+                                                        numpy.arange(len(tags)), 
+                                                        -1))
+        starts = ends - advances - numpy.where(previous >= 0, 
+                                               ends[previous], 0)
+        live = ~newlines & (states != 0)
+        starts, rows, counts, states = (starts[live], rows[live], 
+                                        counts[live], states[live])
+        firsts = numpy.cumsum(counts) - counts
+        xs = numpy.repeat(starts - firsts, counts) + numpy.arange(counts.sum())
+        ys = numpy.repeat(rows, counts)
+        return (xs, ys), numpy.repeat(states, counts)
+
+    def parse(self, body):
+        """Decode the runs of the body of a file one at a time, without
+        NumPy, returning the cells as read does."""
+        xs, ys, states = [], [], []
+        x = y = 0
+        for count, tag in self.token.findall(body):
+            count = count and int(count) or 1
+            if tag == '$':
+                x = 0
+                y += count
+                continue
+            elif tag == '!':
+                break
+            state = self.state(tag)
+            if state:
+                xs.extend(range(x, x + count))
+                ys.extend([y]*count)
+                states.extend([state]*count)
+            x += count
+        return (xs, ys), states
+
+    def state(self, tag):
+        """Return the state a tag stands for."""
+        if tag in 'b.':
+            return 0
+        elif tag == 'o':
+            return 1
+        state = ord(tag[-1]) - ord('A') + 1
+        if len(tag) > 1:
+            state += (ord(tag[0]) - ord('p') + 1)*24
+        return state
+
+    def tag(self, state, multistate):
+        """Return the tag standing for a state."""
+        if not multistate:
+            return 'bo'[state and 1]
+        elif not state:
+            return '.'
+        prefix, state = divmod(state - 1, 24)
+        tag = chr(ord('A') + state)
+        if prefix:
+            tag = chr(ord('p') + prefix - 1) + tag
+        return tag
+
+    def write(self, file, coordinates, states):
+        starts, rows, counts, states = self.runs(coordinates, states)
+        if not len(starts):
+            file.write('x = 0, y = 0\n!\n')
+            return
+        if numpy is None:
+            width = max(map(operator.add, starts, counts))
+            multistate = max(states) > 1
+        else:
+            width = int((starts + counts).max())
+            multistate = int(states.max()) > 1
+        file.write('x = %d, y = %d\n' % (width, rows[-1] + 1))
+        if numpy is None:
+            self.encode(file, starts, rows, counts, states, multistate)
+            return
+        tags = numpy.array([self.tag(x, multistate) 
+                            for x in range(int(states.max()) + 1)])
+        drops = numpy.diff(numpy.r_[0, rows])
+        ends = numpy.r_[0, (starts + counts)[:-1]]
+        gaps = numpy.where(drops > 0, starts, starts - ends)
+        tokens = numpy.char.add(self.counted(drops, '$'), 
+                                self.counted(gaps, self.tag(0, multistate)))
+        tokens = numpy.char.add(tokens, self.counted(counts, tags[states]))
+        tokens = numpy.append(tokens, '!')
+        # Break lines between tokens, so that none is too long.
+        lengths = numpy.char.str_len(tokens)
+        span = max(self.length - int(lengths.max()) + 1, 1)
+        lines = (numpy.cumsum(lengths) - lengths)//span
+        breaks = numpy.diff(numpy.r_[0, lines]) > 0
+        tokens = numpy.where(breaks, numpy.char.add('\n', tokens), tokens)
+        file.write(''.join(tokens.tolist()) + '\n')
+
+    def counted(self, counts, tags):
+        """Return the tokens (as a NumPy array) for runs of the given
+        lengths of the given tags:  nothing for a run of none, and the
+        tag alone for a run of one."""
+        # Most runs are short, so their numbers are looked up rather
+        # than formatted one at a time.
+        short = numpy.array([''] * 2 + [str(x) for x in range(2, 256)])
+        numbers = short[numpy.minimum(counts, 255)]
+        long = counts > 255
+        if long.any():
+            numbers = numpy.where(long, counts.astype(str), numbers)
+        return numpy.where(counts > 0, numpy.char.add(numbers, tags), '')
+
+    def encode(self, file, starts, rows, counts, states, multistate):
+        """Write the runs one at a time, without NumPy."""
+        tokens = []
+        x = y = 0
+        for start, row, count, state in zip(starts, rows, counts, states):
+            if row > y:
+                tokens.append(self.run(row - y, '$'))
+                x = 0
+                y = row
+            if start > x:
+                tokens.append(self.run(start - x, self.tag(0, multistate)))
+            tokens.append(self.run(count, self.tag(state, multistate)))
+            x = start + count
+        tokens.append('!')
+        line = ''
+        for token in tokens:
+            if len(line) + len(token) > self.length:
+                file.write(line + '\n')
+                line = ''
+            line += token
+        file.write(line + '\n')
+
+    def run(self, count, tag):
+        if count == 1:
+            return tag
+        return '%d%s' % (count, tag)
+
+    def runs(self, coordinates, states):
+        """Return the runs of cells in the same state, row by row, as the
+        sequences of the columns they start at, their rows, their
+        lengths and their states, the coordinates relative to the
+        corner of the bounding box of the cells."""
+        xs, ys = coordinates
+        if numpy is None:
+            runs = []
+            if xs:
+                left, top = min(xs), min(ys)
+                for y, x, state in sorted(zip(ys, xs, states)):
+                    x -= left
+                    y -= top
+                    if runs:
+                        start, row, count, last = runs[-1]
+                        if row == y and start + count == x and last == state:
+                            runs[-1][2] += 1
+                            continue
+                    runs.append([x, y, 1, state])
+            return [list(x) for x in zip(*runs)] or [[], [], [], []]
+        xs = numpy.asarray(xs, numpy.int64)
+        ys = numpy.asarray(ys, numpy.int64)
+        states = numpy.asarray(states, numpy.int64)
+        if not len(xs):
+            return xs, ys, xs, states
+        order = numpy.lexsort((xs, ys))
+        xs = xs[order] - xs.min()
+        ys = ys[order] - ys.min()
+        states = states[order]
+        breaks = ((numpy.diff(ys) != 0) | (numpy.diff(xs) != 1) | 
+                  (numpy.diff(states) != 0))
+        starts = numpy.flatnonzero(numpy.r_[1, breaks])
+        counts = numpy.diff(numpy.r_[starts, len(xs)])
+        return xs[starts], ys[starts], counts, states[starts]
+
+
+class Life106File(PatternFile):
+
+    """A Life 1.06 pattern file:  a #Life 1.06 header line, and then
+    the column and row of each live cell, one to a line.  Every cell
+    not in the background state is written as live, at its own
+    address."""
+
+    def read(self, file):
+        if numpy is not None:
+            # A file of nothing but the header has no rows at all (which
+            # loadtxt warns about).
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', UserWarning)
+                cells = numpy.loadtxt(file, numpy.int64, comments='#', 
+                                      ndmin=2)
+            cells = cells.reshape(-1, 2)
+            return ((cells[:, 0], cells[:, 1]), 
+                    numpy.ones(len(cells), numpy.uint8))
+        xs, ys = [], []
+        for line in file:
+            if not line.startswith('#') and line.strip():
+                x, y = line.split()
+                xs.append(int(x))
+                ys.append(int(y))
+        return (xs, ys), [1]*len(xs)
+
+    def write(self, file, coordinates, states):
+        xs, ys = [values(x) for x in coordinates]
+        file.write('#Life 1.06\n')
+        if xs:
+            file.write('\n'.join(map('%d %d'.__mod__, zip(xs, ys))) + '\n')
+
+
+class MacrocellFile(PatternFile):
+
+    """A macrocell pattern file, as used by HashLife programs:  an [M2]
+    header line and comments (starting with #), and then the distinct
+    nodes of the quadtree, each after its quadrants, one to a line and
+    numbered from 1, with 0 standing for an empty node.  Blocks of 8x8
+    cells are given as rows (ending with $) of . and * for background
+    and live cells, and larger nodes by their level and the numbers of
+    their four quadrants (northwest, northeast, southwest, southeast).
+    When read into an empty HashLife map with no offset, the tree is
+    used as it stands, centered on the origin, and the viewport moved
+    to it; otherwise its cells are placed as with any pattern."""
+
+    def tree(self, file, map):
+        """Read the nodes of the file into the HashLife map, and return the
+        last of them (the root of the tree)."""
+        nodes = [None]
+        memo = {}
+        bits = str.maketrans('.*', '01')
+        for line in file:
+            line = line.strip()
+            if not line or line[0] in '[#':
+                continue
+            if line[0] in '.*$':
+                mask = 0
+                for y, row in enumerate(line.split('$')[:8]):
+                    if row:
+                        mask |= int(row.translate(bits)[::-1], 2) << 8*y
+                nodes.append(map.unmask(mask, 3, memo))
+            else:
+                numbers = [int(x) for x in line.split()]
+                level = numbers[0]
+                children = []
+                for number in numbers[1:]:
+                    if number:
+                        children.append(nodes[number])
+                    else:
+                        children.append(map.empty(level - 1))
+                nodes.append(map.join(*children))
+        return nodes[-1]
+
+    def initialize(self, automaton):
+        map = automaton.map
+        if (not isinstance(map, HashLifeTopology) or 
+            self.offset is not None or map.root.population):
+            PatternFile.initialize(self, automaton)
+            return
+        with open(self.filename) as file:
+            root = self.tree(file, map)
+        if root is None:
+            return
+        map.root = root
+        map.origin = -divmod(map.width, 2)[0], -divmod(map.height, 2)[0]
+
+    def read(self, file):
+        scratch = HashLifeTopology((1, 1))
+        root = self.tree(file, scratch)
+        if root is not None:
+            scratch.root = root
+        return scratch.occupied()
+
+    def save(self, map):
+        if isinstance(map, HashLifeTopology):
+            with open(self.filename, 'w') as file:
+                self.dump(file, map, map.root)
+        else:
+            PatternFile.save(self, map)
+
+    def write(self, file, coordinates, states):
+        scratch = HashLifeTopology((1, 1))
+        scratch.place(coordinates, states)
+        self.dump(file, scratch, scratch.root)
+
+    def dump(self, file, map, root):
+        """Write the nodes of a tree in the HashLife map to an open file."""
+        file.write('[M2] (%s %s)\n' % (__program__, __version__))
+        numbers = {}
+        memo = {}
+        rows = []
+        for bits in range(256):
+            row = ''
+            for x in range(8):
+                row += '.*'[bits >> x & 1]
+            rows.append(row.rstrip('.'))
+        stack = [root]
+        while stack:
+            node = stack[-1]
+            if node in numbers or not node.population:
+                stack.pop()
+                continue
+            if node.level > 3:
+                children = node.nw, node.ne, node.sw, node.se
+                pending = [x for x in children 
+                           if x.population and x not in numbers]
+                if pending:
+                    stack.extend(pending)
+                    continue
+                quadrants = [numbers.get(x, 0) for x in children]
+                file.write('%d %d %d %d %d\n' % tuple([node.level] + quadrants))
+            else:
+                mask = map.mask(node, memo)
+                leaf = [rows[mask >> 8*y & 255] for y in range(8)]
+                file.write('$'.join(leaf).rstrip('$') + '$\n')
+            stack.pop()
+            numbers[node] = len(numbers) + 1
+
+
+
+#
+# History
+#
+
+# A history file starts with a signature and version number, followed by
+# a series of chunks, each a header (the length of the rest, the first and
+# last generations in it, and whether it starts with a keyframe) and a
+# compressed pickle of a list of frames:
+# either keyframes, (generation, 1, cells from Topology.dump), or deltas,
+# (generation, 0, indices, state type code, states), the indices and
+# states as raw bytes.  At the end comes a pickled index of the chunks,
+# followed by its offset and the signature again.
+
+HISTORY_SIGNATURE = b'CAGH'
+HISTORY_VERSION = 1
+HISTORY_HEADER = '<IQQB'
+HISTORY_FOOTER = '<Q4s'
+
+
+class Recorder:
+
+    """A recorder writes the run of an automaton to a history file, to be
+    played back later with a HistoryAutomaton.  Call record with the
+    automaton (for instance, as the callback to Automaton.run) after
+    every generation to be kept, and close when done.  A keyframe with
+    all the cells is written every so many generations; otherwise just
+    the cells that changed since the last generation recorded are
+    written, taking time in proportion to their number when the
+    automaton tracks them (see SynchronousAutomaton) and there are no
+    agents, and otherwise found by comparing with a copy of the
+    previous generation.  Frames are gathered into chunks of about the
+    given size before being compressed and written.  Deltas only work
+    with flat maps; for any others, every frame is a keyframe."""
+
+    def __init__(self, filename, keyframes=100, chunk=1 << 20):
+        self.file = open(filename, 'wb')
+        self.file.write(HISTORY_SIGNATURE + struct.pack('<H', HISTORY_VERSION))
+        self.keyframes = keyframes
+        self.chunk = chunk
+        self.index = [] # the offset and header of each chunk
+        self.frames = []
+        self.size = 0
+        self.keyframe = None # the generation of the last keyframe
+        self.generation = None # the generation last recorded
+        self.previous = None
+
+    def record(self, automaton):
+        """Record the current generation of the automaton."""
+        map = automaton.map
+        generation = automaton.generation
+        if (not map.flat or self.keyframe is None or 
+            generation - self.keyframe >= self.keyframes):
+            self.add((generation, 1, map.dump()), map.cells)
+            self.keyframe = generation
+            if map.flat:
+                self.previous = map.buffer.copy()
+        else:
+            buffer, previous = map.buffer, self.previous
+            indices = getattr(automaton, 'changed', None)
+            if (automaton.agents or generation != self.generation + 1):
+                indices = None
+            if map.dtype is not None:
+                if indices is None:
+                    indices = numpy.flatnonzero(buffer != previous)
+                else:
+                    indices = numpy.array(indices, numpy.int64)
+                states = buffer[indices]
+                previous[indices] = states
+                indices = indices.astype(numpy.int64).tobytes()
+                typecode, states = 'q', states.astype(numpy.int64).tobytes()
+            else:
+                if indices is None:
+                    indices = [i for i in range(map.cells) 
+                               if buffer[i] != previous[i]]
+                states = [buffer[i] for i in indices]
+                for index, state in zip(indices, states):
+                    previous[index] = state
+                try:
+                    values = array.array('q', states)
+                except TypeError:
+                    # Not all the states are integers.
+                    values = array.array('d', states)
+                indices = array.array('q', indices).tobytes()
+                typecode, states = values.typecode, values.tobytes()
+            self.add((generation, 0, indices, typecode, states), 
+                     len(indices)//8)
+        self.generation = generation
+
+    def add(self, frame, cells):
+        """Add a frame (of roughly the given number of cells) to the chunk,
+        writing the chunk out if it's full."""
+        if frame[1] and self.frames:
+            # Keyframes start new chunks, so they can be found quickly.
+            self.flush()
+        self.frames.append(frame)
+        self.size += 8*cells
+        if self.size >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        """Write out the chunk gathered so far."""
+        if not self.frames:
+            return
+        first, last = self.frames[0][0], self.frames[-1][0]
+        keyframe = self.frames[0][1]
+        data = zlib.compress(pickle.dumps(self.frames, 
+                                          pickle.HIGHEST_PROTOCOL), 1)
+        self.index.append((self.file.tell(), first, last, keyframe))
+        self.file.write(struct.pack(HISTORY_HEADER, len(data), 
+                                    first, last, keyframe))
+        self.file.write(data)
+        self.frames = []
+        self.size = 0
+
+    def close(self):
+        """Finish the file with its index."""
+        if self.file is None:
+            return
+        self.flush()
+        offset = self.file.tell()
+        self.file.write(pickle.dumps(self.index, pickle.HIGHEST_PROTOCOL))
+        self.file.write(struct.pack(HISTORY_FOOTER, offset, HISTORY_SIGNATURE))
+        self.file.close()
+        self.file = None
+
+
+class HistoryAutomaton(Automaton):
+
+    """An automaton which plays back a history file written by a
+    Recorder into the given map (which should be like the one that was
+    recorded), so that it can be shown by a player or examined;
+    each update moves on to the next generation recorded, and seek
+    jumps straight to any generation, by way of the nearest keyframe
+    before it.  Files which were never closed can still be read, only
+    more slowly to begin with, since the index has to be rebuilt."""
+
+    def __init__(self, filename, map):
+        Automaton.__init__(self, map)
+        self.file = open(filename, 'rb')
+        signature = self.file.read(len(HISTORY_SIGNATURE))
+        if signature != HISTORY_SIGNATURE:
+            raise ValueError("not a history file: %s" % filename)
+        version, = struct.unpack('<H', self.file.read(2))
+        if version != HISTORY_VERSION:
+            raise ValueError("unsupported history version: %d" % version)
+        self.index = self.readIndex()
+        assert self.index, "empty history"
+        self.chunk = None # the number of the chunk being played
+        self.frames = []
+        self.position = 0 # the number of the next frame in the chunk
+        self.seek(self.index[0][1])
+
+    def readIndex(self):
+        """Read the index at the end of the file, or, failing that, build
+        it by going through the chunks."""
+        start = self.file.tell()
+        footer = struct.calcsize(HISTORY_FOOTER)
+        self.file.seek(0, os.SEEK_END)
+        end = self.file.tell()
+        if end - start >= footer:
+            self.file.seek(end - footer)
+            offset, signature = struct.unpack(HISTORY_FOOTER, 
+                                              self.file.read(footer))
+            if signature == HISTORY_SIGNATURE:
+                self.file.seek(offset)
+                return pickle.loads(self.file.read(end - footer - offset))
+        index = []
+        header = struct.calcsize(HISTORY_HEADER)
+        offset = start
+        while offset + header <= end:
+            self.file.seek(offset)
+            length, first, last, keyframe = \
+                    struct.unpack(HISTORY_HEADER, self.file.read(header))
+            if offset + header + length > end:
+                break
+            index.append((offset, first, last, keyframe))
+            offset += header + length
+        return index
+
+    def load(self, chunk):
+        """Read in the frames of the chunk with the given number."""
+        header = struct.calcsize(HISTORY_HEADER)
+        self.file.seek(self.index[chunk][0])
+        length = struct.unpack(HISTORY_HEADER, self.file.read(header))[0]
+        self.frames = pickle.loads(zlib.decompress(self.file.read(length)))
+        self.chunk = chunk
+        self.position = 0
+
+    def apply(self, frame):
+        """Bring the map to the generation of the frame."""
+        if frame[1]:
+            self.map.load(frame[2])
+        else:
+            generation, keyframe, indices, typecode, states = frame
+            indices = array.array('q', indices)
+            states = array.array(typecode, states)
+            buffer = self.map.buffer
+            if self.map.dtype is not None:
+                buffer[numpy.array(indices, numpy.intp)] = states
+            else:
+                for index, state in zip(indices, states):
+                    buffer[index] = state
+            self.map.zobrist = None
+        self.generation = frame[0]
+
+    def running(self):
+        return (self.position < len(self.frames) or 
+                self.chunk + 1 < len(self.index))
+
+    def update(self):
+        if self.position >= len(self.frames):
+            self.load(self.chunk + 1)
+        self.apply(self.frames[self.position])
+        self.position += 1
+
+    def seek(self, generation):
+        """Go to the last generation recorded at or before the given one."""
+        chunk = 0
+        for i in range(len(self.index)):
+            offset, first, last, keyframe = self.index[i]
+            if first > generation:
+                break
+            if keyframe:
+                chunk = i
+        self.load(chunk)
+        while 1:
+            if self.position >= len(self.frames):
+                if self.chunk + 1 >= len(self.index):
+                    break
+                if self.index[self.chunk + 1][1] > generation:
+                    break
+                self.load(self.chunk + 1)
+            frame = self.frames[self.position]
+            if frame[0] > generation:
+                break
+            self.apply(frame)
+            self.position += 1
+
+
 
 #
 # Player
@@ -1173,7 +4350,11 @@ class CursesPlayer(TextPlayer):
 
     """A curses player displays a two-dimensional automaton with some
     simple controls (escape to quit, space to toggle running, enter to
-    single step)."""
+    single step, h, j, k and l to scroll the viewport).  The last frame
+    drawn is kept, and only the cells which differ from it are drawn
+    again:  those the automaton reports as changed, if it keeps track
+    (see SynchronousAutomaton), or else those found by comparing the
+    frames (all at once, for compact maps)."""
     
     def __init__(self, stdscr):
         assert curses
@@ -1184,35 +4365,137 @@ class CursesPlayer(TextPlayer):
         self.width = curses.COLS
         self.height = curses.LINES - 1
         self.size = self.width, self.height
+        self.frame = None # the icons drawn, a row of character codes per line
+        self.shown = None # the origin and generation of the frame
+        self.covered = [] # the screen positions drawn over by agents
+        self.codes = None # the character codes of the states' icons
         self.inited = 1
 
+    def prelim(self):
+        TextPlayer.prelim(self)
+        if numpy is not None and self.states is not None:
+            codes = [ord(self.stateIcon(x)) for x in range(self.states)]
+            self.codes = numpy.array(codes, numpy.uint8)
+
     def status(self):
         self.stdscr.addstr(curses.LINES - 1, 0, \
                            "t = %d" % self.automaton.generation)
 
-    def display(self):
+    def onScreen(self, x, y):
+        """Is the screen position within the map area?"""
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def render(self):
+        """Return the icons of the cells in the viewport, as a list of
+        rows of character codes (or, for compact maps, an array)."""
         map = self.automaton.map
-        self.stdscr.erase()
-        for x in range(map.width):
-            for y in range(map.height):
-                state = map.get((x, y))
+        ox, oy = map.origin
+        width, height = min(map.width, self.width), min(map.height, self.height)
+        if (self.codes is not None and not map.sparse and 
+            (map.dtype is not None or map.packed)):
+            xs = numpy.arange(ox, ox + width)
+            ys = numpy.arange(oy, oy + height)
+            cells = numpy.take(map.array(), xs, 0, mode='wrap')
+            cells = numpy.take(cells, ys, 1, mode='wrap')
+            if map.normalize((-1, 0)) is None:
+                # Beyond the edges is border, not wrapped around.
+                cells[(xs < 0) | (xs >= map.width)] = map.border
+                cells[:, (ys < 0) | (ys >= map.height)] = map.border
+            return self.codes[cells.T]
+        frame = []
+        for y in range(height):
+            row = bytearray(b' '*width)
+            for x in range(width):
+                state = map.get((ox + x, oy + y))
                 if state:
-                    self.stdscr.addch(y, x, self.stateIcon(state))
+                    row[x] = ord(self.stateIcon(state))
+            frame.append(row)
+        return frame
+
+    def draw(self):
+        """Bring the cells on the screen up to date."""
+        automaton = self.automaton
+        map = automaton.map
+        frame = self.frame
+        changed = getattr(automaton, 'changed', None)
+        if (frame is not None and changed is not None and map.flat and 
+            self.shown == (map.origin, automaton.generation - 1)):
+            ox, oy = map.origin
+            wraps = map.normalize((-1, 0)) is not None
+            for index in changed:
+                x, y = divmod(index, map.height)
+                # Where the cell is on the screen, if it is there at all.
+                sx, sy = x - ox, y - oy
+                if wraps:
+                    sx, sy = sx % map.width, sy % map.height
+                if not (0 <= sy < len(frame) and 0 <= sx < len(frame[sy])):
+                    continue
+                code = ord(self.stateIcon(map.get((x, y))))
+                if frame[sy][sx] != code:
+                    frame[sy][sx] = code
+                    self.stdscr.addch(sy, sx, code)
+            return
+        self.frame = self.render()
+        if (frame is None or type(frame) is not type(self.frame) or 
+            len(frame) != len(self.frame) or 
+            len(frame[0]) != len(self.frame[0])):
+            self.stdscr.erase()
+            for y, row in enumerate(self.frame):
+                self.stdscr.addstr(y, 0, bytes(row).decode())
+        elif isinstance(frame, list):
+            for y, row in enumerate(self.frame):
+                if row != frame[y]:
+                    self.stdscr.addstr(y, 0, row.decode())
+        else:
+            # Write over the span of each row that has changed.
+            different = self.frame != frame
+            for y in numpy.flatnonzero(different.any(1)):
+                columns = numpy.flatnonzero(different[y])
+                first, last = columns[0], columns[-1] + 1
+                self.stdscr.addstr(y, first, 
+                                   self.frame[y, first:last].tobytes().decode())
+
+    def display(self):
+        map = self.automaton.map
+        ox, oy = map.origin
+        if self.frame is not None:
+            # Put back what the agents were drawn over.
+            for x, y in self.covered:
+                if y < len(self.frame) and x < len(self.frame[y]):
+                    self.stdscr.addch(y, x, int(self.frame[y][x]))
+                else:
+                    self.stdscr.addch(y, x, ' ')
+        self.covered = []
+        self.draw()
+        self.shown = map.origin, self.automaton.generation
         for agent in self.automaton.agents:
             # Show the agent in reverse video.
             icon = self.stateIcon(map.get(agent.location))
             ax, ay = agent.location
+            ax, ay = ax - ox, ay - oy
+            if not self.onScreen(ax, ay):
+                continue
             self.stdscr.addch(ay, ax, icon, curses.A_REVERSE | curses.A_BOLD)
+            self.covered.append((ax, ay))
             if hasattr(agent, 'direction'):
                 markLocation = agent.direction.advance(agent.location)
-                if map.isNormalized(markLocation):
-                    mx, my = markLocation
+                mx, my = markLocation
+                mx, my = mx - ox, my - oy
+                if map.isNormalized(markLocation) and self.onScreen(mx, my):
                     self.stdscr.addch(my, mx, \
                                       self.directionIcon(agent.direction.offset()), \
                                       curses.A_BOLD)
+                    self.covered.append((mx, my))
         self.status()
         self.stdscr.refresh()
 
+    def scroll(self, dx, dy):
+        """Move the viewport by a quarter screen in the given direction."""
+        map = self.automaton.map
+        ox, oy = map.origin
+        map.origin = ox + dx*(self.width//4), oy + dy*(self.height//4)
+        self.display()
+
     def main(self, automaton):
         Player.main(self, automaton)
         assert self.automaton is not None
@@ -1239,6 +4522,14 @@ class CursesPlayer(TextPlayer):
                 isRunning = -100
             elif char in ('q', 'Q', '\x1b'):
                 return
+            elif char == 'h':
+                self.scroll(-1, 0)
+            elif char == 'j':
+                self.scroll(0, +1)
+            elif char == 'k':
+                self.scroll(0, -1)
+            elif char == 'l':
+                self.scroll(+1, 0)
             if isRunning:
                 self.automaton.update()
                 self.automaton.between()
@@ -24,6 +24,7 @@ def main(stdscr):
     try:
         player = cage.CursesPlayer(stdscr)
         automaton = cage.ConwayAutomaton(player.size)
+        automaton.local = 1
         cage.PatternInitializer(rPentomino).initialize(automaton)
         player.main(automaton)
     finally:
@@ -221,33 +221,44 @@ class LangtonAutomaton(cage.SynchronousAutomaton):
               [ 7, 0, 2, 3, 2, 1 ],
               [ 7, 0, 2, 5, 2, 5 ] ]
 
-    # Create a blank table.
-    table = [None] * states
-    for a in range(states):
-        table[a] = [None] * states
-        for b in range(states):
-            table[a][b] = [None] * states
-            for c in range(states):
-                table[a][b][c] = [None] * states
-                for d in range(states):
-                    table[a][b][c][d] = [0] * states
-
-    # Now populate it.
-    for rule in rules:
-        current, n1, n2, n3, n4, new = rule
-        # The rules are independent of orientation.
-        table[current][n1][n2][n3][n4] = new
-        table[current][n2][n3][n4][n1] = new
-        table[current][n3][n4][n1][n2] = new
-        table[current][n4][n1][n2][n3] = new
+    # The transition table, indexed by the current state and those of the
+    # four neighbors packed together as the digits of a base-8 code (see
+    # encode); it's built on first use and shared by all instances.
+    table = None
 
     def __init__(self, size):
         cage.SynchronousAutomaton.__init__(self, cage.VonNeumannMap(size))
+        if LangtonAutomaton.table is None:
+            LangtonAutomaton.table = self.populate()
+
+    def encode(self, current, n1, n2, n3, n4):
+        return (((current*8 + n1)*8 + n2)*8 + n3)*8 + n4
+
+    def populate(self):
+        """Build the table from the rules."""
+        table = bytearray(self.states**5)
+        for rule in self.rules:
+            current, n1, n2, n3, n4, new = rule
+            # The rules are independent of orientation.
+            table[self.encode(current, n1, n2, n3, n4)] = new
+            table[self.encode(current, n2, n3, n4, n1)] = new
+            table[self.encode(current, n3, n4, n1, n2)] = new
+            table[self.encode(current, n4, n1, n2, n3)] = new
+        return table
 
     def rule(self, address):
-        current = self.map.get(address)
-        states = self.map.states(address)
-        return self.table[current][states[0]][states[1]][states[2]][states[3]]
+        n1, n2, n3, n4 = self.map.states(address)
+        return self.table[self.encode(self.map.get(address), n1, n2, n3, n4)]
+
+    def field(self, padded):
+        """Step every cell at once: compute the codes of all the cells from
+        views of the padded map and look them all up in the table."""
+        codes = self.map.view(padded, self.map.zero).astype(cage.numpy.uint16)
+        for view in self.map.views(padded):
+            codes <<= 3
+            codes |= view
+        table = cage.numpy.frombuffer(self.table, cage.numpy.uint8)
+        return table[codes]
 
 
 def main(stdscr):
@@ -255,6 +266,8 @@ def main(stdscr):
         player = cage.CursesPlayer(stdscr)
         automaton = LangtonAutomaton(player.size)
         cage.StringInitializer(LangtonAutomaton.pattern).initialize(automaton)
+        if cage.numpy is not None:
+            automaton.compact()
         player.main(automaton)
     finally:
         player.done()
@@ -31,7 +31,7 @@ class SugarAutomaton(cage.SynchronousAutomaton):
         elif state == self.SICK:
             return self.HEALTHY
         else:
-            newState = self.map.inclusiveSum(address)/\
+            newState = self.map.inclusiveSum(address)//\
                        (self.map.countNonZero(address) + isUnhealthy) + 15
             if newState >= self.states:
                 newState = self.SICK
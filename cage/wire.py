@@ -15,6 +15,15 @@ import cage
 
 
 class WireAutomaton(cage.SynchronousAutomaton):
+
+    """Only conductors (wire, electron heads and tails) ever change, so
+    the first update compiles the map into a graph of its conductors,
+    and from then on only the cells next to electron heads are looked
+    at, taking time in proportion to the number of electrons rather
+    than the size of the map.  If the map is changed other than by
+    update, reset the conductors attribute to None to have the graph
+    rebuilt."""
+
     states = 4
 
     BACKGROUND, WIRE, HEAD, TAIL = list(range(4))
@@ -146,6 +155,60 @@ class WireAutomaton(cage.SynchronousAutomaton):
 
     def __init__(self, size):
         cage.SynchronousAutomaton.__init__(self, cage.MooreMap(size))
+        self.conductors = None
+
+    def build(self):
+        """Build the graph:  the buffer indices of the conductors, their
+        states, and, for each one, the conductors among its neighbors
+        (those of conductor i being edges[starts[i]:starts[i + 1]])."""
+        map = self.map
+        addresses = []
+        nodes = {}
+        for address in map.addresses():
+            if map.get(address) != WireAutomaton.BACKGROUND:
+                nodes[map.index(address)] = len(addresses)
+                addresses.append(address)
+        self.starts, self.edges = [0], []
+        for address in addresses:
+            for neighbor in map.neighbors(address):
+                neighbor = map.normalize(neighbor)
+                if neighbor is not None:
+                    node = nodes.get(map.index(neighbor))
+                    if node is not None:
+                        self.edges.append(node)
+            self.starts.append(len(self.edges))
+        self.conductors = [map.index(x) for x in addresses]
+        self.wires = [map.get(x) for x in addresses]
+        self.heads = [i for i, state in enumerate(self.wires) 
+                      if state == WireAutomaton.HEAD]
+        self.tails = [i for i, state in enumerate(self.wires) 
+                      if state == WireAutomaton.TAIL]
+
+    def restored(self):
+        cage.SynchronousAutomaton.restored(self)
+        self.conductors = None
+
+    def update(self):
+        if self.conductors is None:
+            self.build()
+        buffer, wires, conductors = self.map.buffer, self.wires, self.conductors
+        counts = {}
+        for node in self.heads:
+            for neighbor in self.edges[self.starts[node]:self.starts[node + 1]]:
+                counts[neighbor] = counts.get(neighbor, 0) + 1
+        heads = [node for node, count in counts.items() 
+                 if count < 3 and wires[node] == WireAutomaton.WIRE]
+        for nodes, state in ((self.tails, WireAutomaton.WIRE), 
+                             (self.heads, WireAutomaton.TAIL), 
+                             (heads, WireAutomaton.HEAD)):
+            for node in nodes:
+                wires[node] = state
+                buffer[conductors[node]] = state
+        self.heads, self.tails = heads, self.heads
+        # The map was updated in place, so any tracking is out of date.
+        self.changed = None
+        self.map.zobrist = None
+        cage.Automaton.update(self)
 
     def rule(self, address):
         state = self.map.get(address)
@@ -0,0 +1,121 @@
+"""
+Check that the faster ways of stepping an automaton (compact maps, packed
+maps, compiled rules, tracking changes, threads, and HashLife) give the
+same cells as applying the rule to every cell in turn.
+"""
+
+import os
+import sys
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'cage'))
+
+import cage
+
+
+LIFE = [3], [2, 3]
+HIGH_LIFE = [3, 6], [2, 3]
+
+
+class RuleOnly(cage.TwoStateTotalisticAutomaton):
+
+    """An automaton whose rule is its own, so that it is always stepped
+    cell by cell (see Automaton.vectorized)."""
+
+    def rule(self, address):
+        return cage.CodedTotalisticRule.rule(self, address)
+
+
+def soup(automaton, seed=1):
+    cage.RandomInitializer(0.35, seed).initialize(automaton)
+    return automaton
+
+def cells(automaton):
+    map = automaton.map
+    return [map.get(address) for address in map.addresses()]
+
+def run(automaton, generations):
+    history = []
+    for generation in range(generations):
+        automaton.update()
+        history.append(cells(automaton))
+    return history
+
+
+@pytest.mark.parametrize('code', [LIFE, HIGH_LIFE])
+def test_compact(code):
+    reference = soup(RuleOnly(cage.MooreMap((40, 30)), code))
+    automaton = soup(cage.TwoStateTotalisticAutomaton(cage.MooreMap((40, 30)),
+                                                      code))
+    automaton.compact()
+    assert automaton.vectorized('field') is not None
+    assert run(automaton, 30) == run(reference, 30)
+
+def test_packed():
+    reference = soup(RuleOnly(cage.MooreMap((40, 30)), LIFE))
+    automaton = cage.TwoStateTotalisticAutomaton(cage.PackedMooreMap((40, 30)),
+                                                 LIFE)
+    automaton.map.place(*reference.map.occupied())
+    assert run(automaton, 30) == run(reference, 30)
+
+@pytest.mark.parametrize('wrap', [0, 1])
+def test_packed_line(wrap):
+    reference = soup(cage.LinearCodedAutomaton((200,), 110, 0, wrap))
+    automaton = cage.LinearCodedAutomaton((200,), 110, 1, wrap)
+    automaton.map.place(*reference.map.occupied())
+    assert run(automaton, 50) == run(reference, 50)
+
+def test_compiled():
+    reference = soup(RuleOnly(cage.MooreMap((40, 30)), HIGH_LIFE))
+    automaton = soup(RuleOnly(cage.MooreMap((40, 30)), HIGH_LIFE))
+    automaton.compile()
+    assert automaton.map.dtype is not None
+    assert run(automaton, 30) == run(reference, 30)
+
+@pytest.mark.parametrize('compact', [0, 1])
+def test_tracking(compact):
+    reference = soup(RuleOnly(cage.MooreMap((40, 30)), LIFE))
+    automaton = soup(RuleOnly(cage.MooreMap((40, 30)), LIFE))
+    automaton.local = 1
+    if compact:
+        automaton.compact()
+    assert run(automaton, 30) == run(reference, 30)
+
+def test_tracking_hash():
+    automaton = soup(cage.ConwayAutomaton((40, 30)))
+    automaton.compact()
+    automaton.local = 1
+    automaton.detectCycles()
+    for generation in range(30):
+        automaton.update()
+        zobrist = automaton.map.fingerprint()
+        automaton.map.zobrist = None
+        assert automaton.map.fingerprint() == zobrist
+
+def test_threaded():
+    reference = soup(RuleOnly(cage.MooreMap((40, 30)), LIFE))
+    automaton = soup(cage.ConwayAutomaton((40, 30)))
+    automaton.threaded(2, 100)
+    try:
+        assert run(automaton, 20) == run(reference, 20)
+    finally:
+        automaton.close()
+
+def test_hashlife():
+    # The torus is large enough that nothing wraps around in the time.
+    pattern = soup(cage.ConwayAutomaton((16, 16))).map.occupied()
+    reference = cage.ConwayAutomaton((160, 160))
+    reference.compact()
+    reference.map.place([[x + 72 for x in axis] for axis in pattern[0]], 
+                        pattern[1])
+    automaton = cage.HashLifeAutomaton((16, 16), LIFE)
+    automaton.map.place(*pattern)
+    for generation in range(64):
+        reference.update()
+    automaton.step(64)
+    xs, ys = automaton.map.occupied()[0]
+    live = set(zip(*reference.map.occupied()[0]))
+    assert set(zip([x + 72 for x in xs], [y + 72 for y in ys])) == live